@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings.settings_common')
 
 application = get_asgi_application()
+
+# Build the refresh token blacklist filter before serving requests
+from event_manager.blacklist import warm_checker  # noqa: E402
+
+warm_checker()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser, Event
+from .models import CustomUser, Event, WaitlistEntry
 
 class CustomUserAdmin(admin.ModelAdmin):
     model = CustomUser
@@ -8,6 +8,11 @@ class EventAdmin(admin.ModelAdmin):
     model = Event
     list_display = ( 'name', 'start_date', 'end_date', 'owner' )
 
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    model = WaitlistEntry
+    list_display = ( 'event', 'position', 'user', 'created_at' )
+
 
 admin.site.register(CustomUser, CustomUserAdmin)
-admin.site.register(Event, EventAdmin)
\ No newline at end of file
+admin.site.register(Event, EventAdmin)
+admin.site.register(WaitlistEntry, WaitlistEntryAdmin)
\ No newline at end of file
@@ -4,3 +4,28 @@ from django.apps import AppConfig
 class EventManagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'event_manager'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals
+        # Tune the SQLite connections
+        from django.db.backends.signals import connection_created
+        from .sqlite import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='event_manager_sqlite')
+        # Count and time the queries of each request
+        from .metrics import install_query_recorder
+        connection_created.connect(install_query_recorder, dispatch_uid='event_manager_metrics')
+        # Re-create the search triggers dropped when migrations rebuild the event table
+        from django.db.models.signals import post_migrate
+        from .search import install_search_index_after_migrate
+        post_migrate.connect(install_search_index_after_migrate, sender=self, dispatch_uid='event_manager_search')
+        # Report a per-process event list cache shared by no one
+        from .cache import check_shared_cache
+        check_shared_cache()
+        # Start the background writers of the queued log handlers
+        from .log_handlers import start_queued_handlers
+        start_queued_handlers()
+        # Prune expired tokens periodically in the processes serving requests
+        from django.core.signals import request_started
+        from .tokens import start_token_pruning
+        request_started.connect(start_token_pruning, dispatch_uid='event_manager_token_pruning')
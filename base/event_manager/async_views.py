@@ -0,0 +1,185 @@
+"""
+ASGI-native (async) versions of the read and registration endpoints.
+
+DRF views are synchronous, so under ASGI each request to event_manager.views
+holds a thread of the sync_to_async pool. These views run on the event loop
+and use the async ORM, so one ASGI worker can serve many concurrent slow
+clients. They return the same payloads as their synchronous counterparts.
+"""
+from datetime import datetime, timezone
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .filters import filter_events, InvalidFilter
+from .metrics import timed
+from .models import AlreadyRegistered, AlreadyWaitlisted, Event, ScheduleConflict
+from .pagination import EventCursorPagination, EventSearchPagination
+from .routers import read_from_replica
+from .search import fts_available, search_filter
+from .serializers import EventListSerializer, EventValuesSerializer, list_fields, only_list_fields
+
+
+def async_jwt_required(view):
+    """
+    Authenticate the request with the JWT authentication of the API.
+
+    The view receives a DRF Request (for query_params and the user); JWT
+    errors and missing credentials are answered with 401, like the DRF views.
+    """
+    authentication = JWTAuthentication()
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            # Looks up the user in the database
+            user_auth = await sync_to_async(authentication.authenticate)(request)
+        except APIException as e:
+            data = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            return JsonResponse(data, status=e.status_code)
+        if user_auth is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        drf_request = Request(request)
+        drf_request.user, drf_request.auth = user_auth
+        return await view(drf_request, *args, **kwargs)
+    return wrapper
+
+
+async def paginated_events(request, events):
+    try:
+        serializer = EventValuesSerializer(list_fields(request.query_params))
+    except InvalidFilter as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    paginator = EventCursorPagination()
+    page = await paginator.apaginate_queryset(serializer.get_queryset(events, *paginator.ordering), request)
+    with timed('serialize'):
+        data = await serializer.ato_representation(page)
+    return JsonResponse({'next': paginator.get_next_link(), 'results': data})
+
+
+def search_page(request, events, query):
+    """
+    Full-text search page of events, as in event_manager.views.list_events.
+    """
+    fields = list_fields(request.query_params)
+    paginator = EventSearchPagination()
+    page = paginator.paginate_search(only_list_fields(events, fields), query, request)
+    with timed('serialize'):
+        data = EventListSerializer(page, many=True, context={'fields': fields}).data
+    return {'next': paginator.get_next_link(), 'results': data}
+
+
+@csrf_exempt
+@require_GET
+@async_jwt_required
+@read_from_replica
+async def list_events(request):
+    """
+    Async version of event_manager.views.list_events (same filters, search and pagination).
+    """
+    query = request.query_params.get('q')
+    try:
+        events = filter_events(Event.objects.all(), request.query_params)
+        if query and fts_available(events.db):
+            # The search runs raw SQL: in a thread
+            return JsonResponse(await sync_to_async(search_page)(request, events, query))
+    except InvalidFilter as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if query:
+        events = events.filter(search_filter(query))
+    return await paginated_events(request, events)
+
+
+@csrf_exempt
+@require_GET
+@async_jwt_required
+@read_from_replica
+async def fetch_user_events(request):
+    """
+    Async version of event_manager.views.fetch_user_events.
+    """
+    return await paginated_events(request, Event.objects.filter(owner=request.user))
+
+
+async def get_future_event(event_id, action):
+    try:
+        event = await Event.objects.aget(id=event_id)
+    except Event.DoesNotExist:
+        raise Http404('Event does not exist')
+    if event.start_date < datetime.now(timezone.utc):
+        return event, JsonResponse({'error': f'You can only {action} for future events.'}, status=status.HTTP_400_BAD_REQUEST)
+    return event, None
+
+
+@csrf_exempt
+@require_POST
+@async_jwt_required
+async def register_event(request, event_id):
+    """
+    Async version of event_manager.views.register_event (same conflicts option).
+    """
+    conflicts = request.query_params.get('conflicts', 'ignore')
+    if conflicts not in ('ignore', 'warn', 'reject'):
+        return JsonResponse(
+            {'error': 'Invalid conflicts option (use ignore, warn or reject)'}, status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    event, error = await get_future_event(event_id, 'register')
+    if error:
+        return error
+
+    # The ORM has no async transactions: run the atomic registration in a thread
+    try:
+        entry = await sync_to_async(event.add_attendee)(
+            request.user, reject_conflicts=conflicts == 'reject', waitlist=True,
+        )
+    except AlreadyRegistered:
+        return JsonResponse({'error': 'You are already registered to this event.'}, status=status.HTTP_400_BAD_REQUEST)
+    except AlreadyWaitlisted:
+        entry = await event.waitlist.filter(user_id=request.user.pk).afirst()
+        if entry is None:
+            return JsonResponse({'error': 'You are already registered to this event.'}, status=status.HTTP_400_BAD_REQUEST)
+    except ScheduleConflict as e:
+        return JsonResponse(
+            {'error': 'The event overlaps events you are registered to.', 'conflicts': e.conflicts},
+            status=status.HTTP_409_CONFLICT,
+        )
+    if entry is not None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Event has reached its maximum capacity',
+            'waitlisted': True,
+            'position': await sync_to_async(entry.get_place)(),
+            'status_url': reverse('event-status', args=[event.pk]),
+        }, status=status.HTTP_202_ACCEPTED)
+    data = {'success': True, 'messagge': 'user registred for the event'}
+    if conflicts == 'warn':
+        data['conflicts'] = await sync_to_async(event.get_conflicts)(request.user)
+    return JsonResponse(data)
+
+
+@csrf_exempt
+@require_POST
+@async_jwt_required
+async def unregister_event(request, event_id):
+    """
+    Async version of event_manager.views.unregister_event.
+    """
+    event, error = await get_future_event(event_id, 'unregister')
+    if error:
+        return error
+
+    if await sync_to_async(event.remove_attendee)(request.user):
+        return JsonResponse({'success': True, 'messagge': 'user unregistred for the event'})
+    if await sync_to_async(event.leave_waitlist)(request.user):
+        return JsonResponse({'success': True, 'messagge': 'user removed from the waitlist'})
+    return JsonResponse({'success': True, 'error': 'User is not registered for this event'})
@@ -0,0 +1,150 @@
+"""
+Helpers shared by the benchmark management commands (bench_*).
+
+Benchmarks seed and query a throw-away test database, never the configured one.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .models import CustomUser, Event
+
+
+@contextmanager
+def benchmark_database(name=None):
+    """
+    Create a test database for the duration of a benchmark.
+
+    SQLite test databases are in memory by default, where concurrent writers
+    fail with "database table is locked" instead of waiting; benchmarks use a
+    temporary file instead, like a deployed SQLite database.
+
+    Args:
+        name (str): Optional test database name (file path for SQLite).
+    """
+    directory = None
+    if not name and connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp(prefix='event_manager_bench_')
+        name = os.path.join(directory, 'bench.sqlite3')
+    if name:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = name
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def seed(users=10, events=1000, attendances=0, start=None, batch_size=1000):
+    """
+    Insert benchmark data: users (without usable password), events spread one
+    hour apart and owned round-robin, and attendances spread over the events.
+
+    Returns:
+        tuple: The users and the events.
+    """
+    start = start or datetime.now(timezone.utc) + timedelta(days=1)
+    user_list = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench{i}', email=f'bench{i}@example.com', password='!')
+        for i in range(users)
+    ], batch_size=batch_size)
+    event_list = Event.objects.bulk_create([
+        Event(
+            name=f'Event {i}',
+            description=f'Benchmark event {i}',
+            location=f'Room {i % 50}',
+            start_date=start + timedelta(hours=i),
+            end_date=start + timedelta(hours=i + 2),
+            owner=user_list[i % users],
+        )
+        for i in range(events)
+    ], batch_size=batch_size)
+    if attendances:
+        through = Event.attendees.through
+        rows = [
+            through(event=event_list[i % events], customuser=user_list[(i // events) % users])
+            for i in range(min(attendances, events * users))
+        ]
+        through.objects.bulk_create(rows, batch_size=batch_size)
+        Event.objects.refresh_attendee_counts()
+    return user_list, event_list
+
+
+def auth_header(user):
+    access, _ = user.generate_tokens()
+    return f'Bearer {access}'
+
+
+def summarize(latencies, elapsed=None):
+    """
+    Summarize latencies (in seconds) as milliseconds percentiles, and the
+    throughput if the elapsed wall time is given.
+    """
+    latencies = sorted(latencies)
+    summary = {'count': len(latencies)}
+    if latencies:
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))] * 1000
+        summary.update({
+            'mean_ms': statistics.fmean(latencies) * 1000,
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'max_ms': latencies[-1] * 1000,
+        })
+    if elapsed:
+        summary['throughput_per_s'] = len(latencies) / elapsed
+    return summary
+
+
+def run_concurrently(func, args, concurrency):
+    """
+    Call func on each of args from a pool of threads.
+
+    Returns:
+        tuple: The results, the latency of each call and the elapsed wall time.
+    """
+    def timed(arg):
+        started = time.perf_counter()
+        result = func(arg)
+        return result, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, args))
+    elapsed = time.perf_counter() - started
+    return [result for result, _ in outcomes], [latency for _, latency in outcomes], elapsed
+
+
+def write_report(stdout, report, as_json):
+    """
+    Write a benchmark report, as JSON or as indented text.
+    """
+    if as_json:
+        stdout.write(json.dumps(report, indent=2, default=str))
+        return
+
+    def write(data, indent=0):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                stdout.write(' ' * indent + f'{key}:')
+                write(value, indent + 2)
+            elif isinstance(value, float):
+                stdout.write(' ' * indent + f'{key}: {value:.2f}')
+            else:
+                stdout.write(' ' * indent + f'{key}: {value}')
+    write(report)
@@ -0,0 +1,273 @@
+"""
+Refresh token blacklist checks that skip the database for clean tokens.
+
+simplejwt checks the token_blacklist table on every refresh. The checker
+configured by EVENT_MANAGER_BLACKLIST_CHECKER keeps the blacklisted JTIs of
+the process in a bloom filter: a token missing from the filter is not
+blacklisted (no query), a token found in it is confirmed by the database, which
+stays the source of truth.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger('event_manager')
+
+
+class BloomFilter:
+    """
+    Fixed size bloom filter of strings.
+
+    Args:
+        capacity (int): Number of items for which the false positive rate holds.
+        error_rate (float): Target false positive rate at capacity.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    def expected_error_rate(self):
+        """
+        Theoretical false positive rate for the number of added items.
+        """
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+
+class DatabaseBlacklistChecker:
+    """
+    Blacklist checker querying the database for every token (simplejwt's behaviour).
+    """
+
+    def is_blacklisted(self, jti):
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def add(self, jti):
+        pass
+
+    def stats(self):
+        return {'checker': type(self).__name__}
+
+
+class BloomBlacklistChecker(DatabaseBlacklistChecker):
+    """
+    Blacklist checker answering from a bloom filter of the blacklisted JTIs.
+
+    The filter is warmed from the database when the process starts (see
+    warm_checker; else on the first check), updated in-process by add() (logout
+    and rotation), and resynced every sync_interval seconds with the rows added
+    since the last sync, so that tokens blacklisted by other processes are
+    rejected after at most sync_interval seconds. When more than capacity JTIs
+    were added, the filter is rebuilt from the blacklisted tokens that have not
+    expired yet. One thread at a time warms or resyncs the filter.
+
+    Args:
+        capacity (int): Expected number of unexpired blacklisted tokens.
+        error_rate (float): Target false positive rate of the filter.
+        sync_interval (float): Seconds between two incremental resyncs.
+        sync_overlap (int): Blacklist ids re-read on each resync, so that rows
+            committed out of id order are not missed.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001, sync_interval=1.0, sync_overlap=1000):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.sync_overlap = sync_overlap
+        self._lock = threading.Lock()
+        # Held while warming or resyncing, so that only one thread reads the table
+        self._refresh_lock = threading.RLock()
+        self.filter = None
+        self.last_id = 0
+        self.synced_at = 0
+        self.checks = 0
+        self.negatives = 0
+        self.blacklisted = 0
+        self.false_positives = 0
+
+    def warm(self):
+        """
+        (Re)build the filter from the unexpired blacklisted tokens.
+        """
+        with self._refresh_lock:
+            rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list('id', 'token__jti')
+            bloom = BloomFilter(self.capacity, self.error_rate)
+            last_id = 0
+            for pk, jti in rows.iterator(chunk_size=10000):
+                bloom.add(jti)
+                last_id = max(last_id, pk)
+            with self._lock:
+                self.filter = bloom
+                self.last_id = last_id
+                self.synced_at = time.monotonic()
+
+    def sync(self):
+        """
+        Add the tokens blacklisted since the last sync.
+        """
+        with self._refresh_lock:
+            rows = BlacklistedToken.objects.filter(id__gt=self.last_id - self.sync_overlap).values_list('id', 'token__jti')
+            with self._lock:
+                for pk, jti in rows:
+                    if jti not in self.filter:
+                        self.filter.add(jti)
+                    self.last_id = max(self.last_id, pk)
+                self.synced_at = time.monotonic()
+
+    def _needs_warm(self):
+        return self.filter is None or len(self.filter) > self.capacity
+
+    def _refresh(self):
+        if self._needs_warm():
+            with self._refresh_lock:
+                # Warmed by another thread while this one waited
+                if self._needs_warm():
+                    self.warm()
+        elif time.monotonic() - self.synced_at >= self.sync_interval:
+            # One thread resyncs, the others keep answering from the current filter
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self.synced_at >= self.sync_interval:
+                        self.sync()
+                finally:
+                    self._refresh_lock.release()
+
+    def is_blacklisted(self, jti):
+        self._refresh()
+        if jti not in self.filter:
+            with self._lock:
+                self.checks += 1
+                self.negatives += 1
+            return False
+        blacklisted = super().is_blacklisted(jti)
+        with self._lock:
+            self.checks += 1
+            if blacklisted:
+                self.blacklisted += 1
+            else:
+                self.false_positives += 1
+        return blacklisted
+
+    def add(self, jti):
+        if self.filter is None:
+            # Warmed (with this token) on the first check
+            return
+        with self._lock:
+            if jti not in self.filter:
+                self.filter.add(jti)
+
+    def stats(self):
+        with self._lock:
+            clean = self.negatives + self.false_positives
+            return {
+                'checker': type(self).__name__,
+                'checks': self.checks,
+                'skipped_database': self.negatives,
+                'blacklisted': self.blacklisted,
+                'false_positives': self.false_positives,
+                # Share of clean tokens that still needed a query
+                'false_positive_rate': self.false_positives / clean if clean else None,
+                'expected_false_positive_rate': self.filter.expected_error_rate() if self.filter else None,
+                'filter_items': len(self.filter) if self.filter else 0,
+                'filter_bytes': len(self.filter.bits) if self.filter else 0,
+            }
+
+
+_checker = None
+_checker_lock = threading.Lock()
+
+
+def get_checker():
+    """
+    Return the blacklist checker of this process, built from EVENT_MANAGER_BLACKLIST_CHECKER.
+    """
+    global _checker
+    if _checker is None:
+        with _checker_lock:
+            if _checker is None:
+                config = settings.EVENT_MANAGER_BLACKLIST_CHECKER
+                _checker = import_string(config['CLASS'])(**config.get('OPTIONS', {}))
+    return _checker
+
+
+def warm_checker():
+    """
+    Build the blacklist checker of this process and warm its filter, so that
+    the first requests do not. Called by the WSGI and ASGI entry points.
+    """
+    warm = getattr(get_checker(), 'warm', None)
+    if warm is None:
+        return
+    try:
+        warm()
+    except DatabaseError as e:
+        # E.g. not migrated yet: warmed on the first check instead
+        logger.warning(f'Blacklist checker not warmed: {e}')
+    finally:
+        # Do not hand a connection over to forked workers
+        connections.close_all()
+
+
+def reset_checker():
+    """
+    Drop the checker of this process; the next get_checker() builds a new one.
+    """
+    global _checker
+    with _checker_lock:
+        _checker = None
+
+
+class CheckedRefreshToken(RefreshToken):
+    """
+    Refresh token checking and updating the blacklist through get_checker().
+    """
+
+    def check_blacklist(self):
+        if get_checker().is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        result = super().blacklist()
+        get_checker().add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+class CheckedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    TokenRefreshSerializer using CheckedRefreshToken, also for the blacklisting on rotation.
+    """
+    token_class = CheckedRefreshToken
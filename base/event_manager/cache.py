@@ -0,0 +1,186 @@
+"""
+Event list response cache.
+
+Pages are cached under a generation number that every write to events bumps
+(see invalidate_event_list), so invalidating drops every page at once. The
+generation is kept in the EVENT_MANAGER_CACHE cache itself: with several worker
+processes, that cache must be shared by all of them (e.g. Redis or Memcached,
+whose incr is atomic). With a per-process backend such as the local-memory one,
+a write only invalidates the pages of the process that handled it, and the
+other processes serve stale lists for up to the cache TIMEOUT (see
+check_shared_cache).
+"""
+import functools
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .routers import pinned_to_primary, reads_from_replica
+
+logger = logging.getLogger('event_manager')
+
+# Cache key of the event list generation, bumped on every write to events
+GENERATION_KEY = 'events:generation'
+# Cache key set for EVENT_MANAGER_REPLICA_PIN_SECONDS after each write to events
+RECENT_WRITE_KEY = 'events:recent_write'
+
+
+class CacheStats:
+    """
+    Thread safe hit/miss counters of the event list cache (per process).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else None,
+            }
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[settings.EVENT_MANAGER_CACHE]
+
+
+def check_shared_cache():
+    """
+    Warn if the event list cache is local to each process while several worker
+    processes (EVENT_MANAGER_WORKERS) serve requests.
+
+    Returns:
+        bool: Whether the configuration is safe.
+    """
+    if settings.EVENT_MANAGER_WORKERS > 1 and isinstance(get_cache(), LocMemCache):
+        logger.warning(
+            'The %r cache is local to each of the %d worker processes: writes only invalidate '
+            'the event lists cached by the process that handled them. Use a shared cache backend.',
+            settings.EVENT_MANAGER_CACHE, settings.EVENT_MANAGER_WORKERS,
+        )
+        return False
+    return True
+
+
+def get_generation(cache):
+    """
+    Return the current event list generation.
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Never restart from a small number: pages cached under an evicted
+        # generation must not become visible again
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate_event_list():
+    """
+    Bump the event list generation, so that every cached page becomes stale.
+    """
+    cache = get_cache()
+    if settings.EVENT_MANAGER_DATABASE_REPLICAS:
+        # Before the bump: requests that see the new generation see the flag too
+        cache.set(RECENT_WRITE_KEY, True, timeout=settings.EVENT_MANAGER_REPLICA_PIN_SECONDS)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def replicas_may_lag(cache):
+    """
+    Whether the current request reads from a replica that may not have the last
+    write to events yet (made less than EVENT_MANAGER_REPLICA_PIN_SECONDS ago).
+
+    What such a request reads must not be cached under the new generation, where
+    it would stay stale until the next write. Check it after reading the
+    generation: invalidate_event_list sets the flag before bumping it.
+    """
+    return reads_from_replica() and bool(cache.get(RECENT_WRITE_KEY))
+
+
+def invalidate_event_list_on_commit():
+    """
+    Bump the event list generation once the current transaction commits.
+
+    Bumping before the commit would let a concurrent request cache the old
+    rows under the new generation.
+    """
+    transaction.on_commit(invalidate_event_list)
+
+
+def request_fingerprint(request, *extra):
+    """
+    Hash a request by its path and normalized (sorted) query parameters.
+
+    The pagination links are absolute, so the scheme and host are included.
+    """
+    params = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    raw = repr((request.scheme, request.get_host(), request.path, params) + extra)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def get_cache_key(request, generation):
+    """
+    Build the cache key of a request from its normalized query parameters.
+    """
+    return f'events:list:{generation}:{request_fingerprint(request)}'
+
+
+def cache_event_list(view):
+    """
+    Cache the successful responses of an event list view.
+
+    Responses are cached by query parameters under the current generation,
+    so writes (see invalidate_event_list) are visible immediately. The
+    ``X-Cache`` header tells whether the response was served from the cache.
+    Requests pinned to the primary database bypass the cache, which may hold
+    pages read from a lagging replica; pages read from a replica right after a
+    write are not cached (see replicas_may_lag).
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if pinned_to_primary():
+            return view(request, *args, **kwargs)
+        cache = get_cache()
+        key = get_cache_key(request, get_generation(cache))
+        data = cache.get(key)
+        if data is not None:
+            stats.hit()
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        stats.miss()
+        lagging = replicas_may_lag(cache)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not lagging:
+            cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
@@ -0,0 +1,113 @@
+"""
+Response compression negotiated with the Accept-Encoding request header.
+
+Responses of at least EVENT_MANAGER_COMPRESSION_MIN_SIZE bytes, and streamed
+responses, are compressed with Brotli (when the brotli package is installed) or
+gzip, whichever the client prefers (Brotli on equal q-values: it is smaller).
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header into a {coding: q-value} dict.
+    """
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def choose_encoding(header):
+    """
+    Return the supported content coding preferred by a client ('br' or 'gzip'),
+    or None to send the response uncompressed.
+    """
+    codings = parse_accept_encoding(header)
+    supported = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best, best_quality = None, 0.0
+    for coding in supported:
+        quality = codings.get(coding, codings.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def brotli_sequence(sequence, quality):
+    """
+    Compress a sequence of byte strings with Brotli, flushing after each one so
+    that streamed responses are sent as they are produced.
+    """
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware with a size threshold and Brotli support.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.EVENT_MANAGER_COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding == 'gzip':
+            return super().process_response(request, response)
+        if encoding != 'br':
+            return response
+
+        quality = settings.EVENT_MANAGER_BROTLI_QUALITY
+        if response.streaming:
+            if response.is_async:
+                original_iterator = response.streaming_content
+
+                async def brotli_wrapper():
+                    compressor = brotli.Compressor(quality=quality)
+                    async for chunk in original_iterator:
+                        yield compressor.process(chunk) + compressor.flush()
+                    yield compressor.finish()
+
+                response.streaming_content = brotli_wrapper()
+            else:
+                response.streaming_content = brotli_sequence(response.streaming_content, quality)
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(response.content, quality=quality)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # Like GZipMiddleware: the ETag of the uncompressed content becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
@@ -0,0 +1,79 @@
+import functools
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+
+from .cache import get_cache, get_generation, replicas_may_lag, request_fingerprint
+from .filters import InvalidFilter
+from .routers import pinned_to_primary
+
+
+def get_event_list_etag(request, events, *extra):
+    """
+    Compute the ETag of an event list response without serializing it.
+
+    A single aggregate query returns the number of events and the last time
+    one of them changed; any create, edit, delete or (un)registration changes
+    one of the two. The ETag is cached under the event list generation (see
+    event_manager.cache), which every write bumps, so until the next write the
+    aggregate runs once per request fingerprint.
+
+    There is no Last-Modified validator: deleting an event other than the last
+    updated one does not change the latest updated_at.
+
+    Args:
+        request (Request): The request, whose query parameters are part of the ETag.
+        events (QuerySet): The (filtered, unpaginated) events of the response.
+        *extra: Other values the response depends on (e.g. the user).
+
+    Returns:
+        str: The ETag.
+    """
+    # Like cache_event_list: pinned requests must not see validators read from a replica
+    cache = None if pinned_to_primary() else get_cache()
+    if cache is not None:
+        key = f'events:etag:{get_generation(cache)}:{request_fingerprint(request, *extra)}'
+        etag = cache.get(key)
+        if etag is not None:
+            return etag
+        if replicas_may_lag(cache):
+            cache = None
+
+    aggregate = events.order_by().aggregate(count=Count('id'), last_modified=Max('updated_at'))
+    last_modified = aggregate['last_modified']
+    etag = '"%s"' % request_fingerprint(
+        request, aggregate['count'], last_modified.isoformat() if last_modified else None, *extra
+    )
+    if cache is not None:
+        cache.set(key, etag)
+    return etag
+
+
+def conditional_event_list(get_events):
+    """
+    Add an ETag validator to an event list view, and answer ``304 Not
+    Modified`` to matching If-None-Match requests without running the view.
+
+    Args:
+        get_events: Callable returning the events of the response for a request,
+            and the extra values the response depends on.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                events, extra = get_events(request)
+            except InvalidFilter:
+                # Let the view report the error
+                return view(request, *args, **kwargs)
+
+            etag = get_event_list_etag(request, events, *extra)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,69 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import serializers
+
+# Columns of the export, in order; owner is the username of the owner
+EXPORT_FIELDS = (
+    'id', 'name', 'description', 'start_date', 'end_date', 'max_capacity',
+    'location', 'attendee_count', 'owner',
+)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """
+    Pseudo-buffer for csv.writer: write() returns the row instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_event_rows(events):
+    """
+    Iterate over the export rows of the events, as dicts.
+
+    Rows are read from the database in chunks of EVENT_MANAGER_EXPORT_CHUNK_SIZE
+    with QuerySet.iterator(), so memory stays flat whatever the number of events.
+    """
+    # Same datetime representation as EventSerializer
+    datetime_field = serializers.DateTimeField()
+    columns = [('owner__username' if name == 'owner' else name) for name in EXPORT_FIELDS]
+    rows = events.order_by('start_date', 'id').values_list(*columns)
+    for row in rows.iterator(chunk_size=settings.EVENT_MANAGER_EXPORT_CHUNK_SIZE):
+        row = dict(zip(EXPORT_FIELDS, row))
+        row['start_date'] = datetime_field.to_representation(row['start_date'])
+        row['end_date'] = datetime_field.to_representation(row['end_date'])
+        yield row
+
+
+def stream_ndjson(events):
+    for row in iter_event_rows(events):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_csv(events):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in iter_event_rows(events):
+        yield writer.writerow(row[name] for name in EXPORT_FIELDS)
+
+
+def stream_events(events, export_format):
+    """
+    Return the streamed content of an export of the events.
+
+    Args:
+        events (QuerySet): The events to export.
+        export_format (str): One of EXPORT_FORMATS.
+    """
+    if export_format == 'csv':
+        return stream_csv(events)
+    return stream_ndjson(events)
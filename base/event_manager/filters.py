@@ -0,0 +1,143 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Event
+
+
+class InvalidFilter(ValueError):
+    """
+    A listing filter has an invalid value; the message is meant for the client.
+    """
+
+
+def day_start(day):
+    """
+    Return the aware datetime at which a day starts in the current timezone.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_range(day):
+    """
+    Return the half-open datetime range [start, end) covering a day in the current timezone.
+
+    Filtering with ``field__gte=start, field__lt=end`` is equivalent to
+    ``field__date=day`` but, unlike the ``__date`` transform, can use an index
+    on the field.
+    """
+    return day_start(day), day_start(day + timedelta(days=1))
+
+
+def parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise InvalidFilter('Invalid date filter (use YYYY-MM-DD format)')
+
+
+def parse_instant(value):
+    """
+    Parse an ISO 8601 datetime, or a date (its start in the current timezone).
+    """
+    try:
+        instant = parse_datetime(value)
+        if instant is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError
+            return day_start(day)
+    except ValueError:
+        raise InvalidFilter('Invalid from/to filter (use an ISO 8601 date or datetime)')
+    if timezone.is_naive(instant):
+        instant = timezone.make_aware(instant)
+    return instant
+
+
+def overlap_filter(start=None, end=None):
+    """
+    Build the predicate of the events overlapping the window [start, end).
+
+    ``start_date < end AND end_date > start`` alone only bounds start_date
+    from above, so the database reads every event that started before the
+    window. Events lasting at most EVENT_MANAGER_OVERLAP_MAX_DURATION started
+    less than that before the window, which bounds their (start_date, id) index
+    range; the few longer events are matched by id, through a subquery on the
+    (duration, ...) index. The database then sorts the matches of the window
+    instead of reading the events in (start_date, id) order.
+    """
+    condition = Q()
+    if end is not None:
+        condition &= Q(start_date__lt=end)
+    if start is not None:
+        condition &= Q(end_date__gt=start)
+    if start is None or end is None:
+        return condition
+
+    max_duration = settings.EVENT_MANAGER_OVERLAP_MAX_DURATION
+    limit = max_duration.total_seconds()
+    # One second of slack for the rounding of the computed durations
+    short = condition & Q(start_date__gte=start - max_duration - timedelta(seconds=1), duration__lte=limit)
+    long = Event.objects.filter(condition, duration__gt=limit).values('id')
+    return short | Q(id__in=long)
+
+
+def filter_events(events, query_params):
+    """
+    Apply the filters shared by the event listing endpoints.
+
+    Args:
+        events (QuerySet): The events to filter.
+        query_params (QueryDict): The query parameters of the request:
+            - status: upcoming, ongoing or past, relative to the start of today
+            - start_date: events starting on this day (YYYY-MM-DD)
+            - end_date: events ending on this day (YYYY-MM-DD)
+            - from, to: events overlapping the window [from, to) (ISO 8601
+              datetimes, or dates for their start); either may be omitted
+
+    Returns:
+        QuerySet: The filtered events.
+
+    Raises:
+        InvalidFilter: If a filter has an invalid value.
+    """
+    status = query_params.get('status')
+    start_date = query_params.get('start_date')
+    end_date = query_params.get('end_date')
+
+    # Filter events by status
+    if status:
+        today = day_start(timezone.localdate())
+        if status == 'upcoming':
+            events = events.filter(start_date__gte=today)
+        elif status == 'ongoing':
+            events = events.filter(start_date__lte=today, end_date__gte=today)
+        elif status == 'past':
+            # Events end after they start: the start_date bound lets the
+            # (start_date, id) index serve both the filter and the ordering
+            events = events.filter(start_date__lt=today, end_date__lt=today)
+        else:
+            raise InvalidFilter('Invalid status filter')
+
+    # Filter events by date
+    if start_date:
+        start, end = day_range(parse_day(start_date))
+        events = events.filter(start_date__gte=start, start_date__lt=end)
+    if end_date:
+        start, end = day_range(parse_day(end_date))
+        events = events.filter(end_date__gte=start, end_date__lt=end)
+
+    # Filter events by overlap with a time window
+    window_start = query_params.get('from')
+    window_end = query_params.get('to')
+    if window_start or window_end:
+        window_start = parse_instant(window_start) if window_start else None
+        window_end = parse_instant(window_end) if window_end else None
+        if window_start and window_end and window_start >= window_end:
+            raise InvalidFilter('Invalid from/to filter (from must be before to)')
+        events = events.filter(overlap_filter(window_start, window_end))
+
+    return events
@@ -0,0 +1,97 @@
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+
+
+class BlockingSentinelQueueListener(QueueListener):
+    """
+    QueueListener whose stop() waits for room in a bounded queue instead of
+    raising queue.Full.
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class QueuedRotatingFileHandler(QueueHandler):
+    """
+    Logging handler writing to a size-rotated file from a background thread.
+
+    Records are formatted by this handler, put in a bounded queue and written
+    by a QueueListener thread (started by EventManagerConfig.ready()), so slow
+    disks never add latency to the views. When the queue is full, records are
+    handled according to drop_policy:
+
+        - drop_new: drop the incoming record
+        - drop_oldest: drop the oldest queued record to make room
+        - block: wait for room (disk latency is back on the request path)
+
+    Args:
+        filename (str): Path of the log file.
+        max_bytes (int): Size at which the file is rotated (0 never rotates).
+        backup_count (int): Number of rotated files to keep.
+        queue_size (int): Maximum number of queued records.
+        drop_policy (str): One of DROP_POLICIES.
+    """
+    DROP_POLICIES = ('drop_new', 'drop_oldest', 'block')
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000,
+                 drop_policy='drop_new', encoding='utf-8'):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f'Invalid drop_policy {drop_policy!r}, use one of {self.DROP_POLICIES}')
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.target = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        self.listener = BlockingSentinelQueueListener(self.queue, self.target)
+        self._started = False
+
+    def enqueue(self, record):
+        if self.drop_policy == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.drop_policy == 'drop_oldest':
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        # Counter of lost records (approximate under contention)
+        self.dropped += 1
+
+    def start(self):
+        """
+        Start the writer thread (idempotent); it is stopped at exit.
+        """
+        if not self._started:
+            self._started = True
+            self.listener.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """
+        Write the queued records and stop the writer thread.
+        """
+        if self._started:
+            self._started = False
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        super().close()
+
+
+def start_queued_handlers(logger_name='event_manager'):
+    """
+    Start the writer threads of the queued handlers of a logger.
+    """
+    for handler in logging.getLogger(logger_name).handlers:
+        if isinstance(handler, QueuedRotatingFileHandler):
+            handler.start()
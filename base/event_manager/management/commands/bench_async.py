@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from event_manager.bench import auth_header, benchmark_database, run_concurrently, seed, summarize, write_report
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the throughput of the sync (DRF) and async (ASGI-native) event '
+        'list endpoints under concurrency, on a throw-away test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=2000, help='Number of events to seed.')
+        parser.add_argument('--requests', type=int, default=500, help='Number of requests per variant.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Number of concurrent clients.')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            users, _ = seed(users=10, events=options['events'])
+            authorization = auth_header(users[0])
+            params = {'page_size': options['page_size']}
+
+            sync = self.bench_sync(reverse('all-events'), params, authorization, options)
+            async_ = asyncio.run(self.bench_async(reverse('async-all-events'), params, authorization, options))
+
+        write_report(self.stdout, {
+            'events': options['events'],
+            'concurrency': options['concurrency'],
+            'sync': sync,
+            'async': async_,
+        }, options['json'])
+
+    def bench_sync(self, url, params, authorization, options):
+        def request(_):
+            return Client().get(url, params, HTTP_AUTHORIZATION=authorization).status_code
+
+        statuses, latencies, elapsed = run_concurrently(request, range(options['requests']), options['concurrency'])
+        return dict(summarize(latencies, elapsed), errors=sum(code != 200 for code in statuses))
+
+    async def bench_async(self, url, params, authorization, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        client = AsyncClient()
+        latencies = []
+
+        async def request():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url, params, headers={'Authorization': authorization})
+                latencies.append(time.perf_counter() - started)
+                return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(request() for _ in range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        return dict(summarize(latencies, elapsed), errors=sum(code != 200 for code in statuses))
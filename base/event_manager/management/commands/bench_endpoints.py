@@ -0,0 +1,243 @@
+from datetime import datetime, timedelta, timezone
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from event_manager.bench import auth_header, benchmark_database, run_concurrently, seed, summarize, write_report
+from event_manager.metrics import registry as metrics_registry
+from event_manager.models import CustomUser
+
+PASSWORD = 'bench-password-1'
+# Dedicated users registering to events, so that registrations never collide
+# with the seeded attendances
+ATTENDEES = 20
+
+
+def bench_client():
+    """
+    Test client returning 500 responses instead of raising the view exceptions,
+    so that server errors count as errors of the scenario instead of ending the run.
+    """
+    return Client(raise_request_exception=False)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the event_manager endpoints under concurrency through the test client, on a '
+        'throw-away test database: p50/p95/p99 latency, throughput and queries per request of each '
+        'scenario, as JSON to compare between commits (see --output and --baseline).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--events', type=int, default=10000)
+        parser.add_argument('--attendances', type=int, default=50000)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--scenarios', nargs='+', help='Only run these scenarios.')
+        parser.add_argument(
+            '--hasher',
+            help='Password hasher to use instead of PASSWORD_HASHERS[0] for register_user and login_user '
+                 '(e.g. django.contrib.auth.hashers.MD5PasswordHasher).',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='JSON report of a previous run to compare with.')
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['scenarios']
+
+        hashers = list(settings.PASSWORD_HASHERS)
+        if options['hasher']:
+            hashers.insert(0, options['hasher'])
+
+        with override_settings(PASSWORD_HASHERS=hashers), benchmark_database():
+            data = self.seed(options)
+            scenarios = self.get_scenarios(data, options)
+            selected = options['scenarios'] or list(scenarios)
+            unknown = set(selected) - set(scenarios)
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+            # Load the URLconf, serializers... before measuring
+            bench_client().get(reverse('all-events'), HTTP_AUTHORIZATION=data['authorization'])
+            results = {name: self.run_scenario(*scenarios[name], options) for name in selected}
+
+        if baseline:
+            for name, result in results.items():
+                if name in baseline:
+                    result['baseline'] = self.compare(result, baseline[name])
+        report = {
+            'meta': self.get_meta(options, hashers[0]),
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, default=str)
+        write_report(self.stdout, report, options['json'])
+
+    def seed(self, options):
+        """
+        Seed the users, events (half past, half upcoming, one hour apart) and
+        attendances, and the users of the login and registration scenarios.
+        """
+        if options['users'] < 1 or options['events'] < 2:
+            raise CommandError('At least 1 user and 2 events are needed.')
+        start = datetime.now(timezone.utc) - timedelta(hours=options['events'] // 2)
+        users, events = seed(
+            users=options['users'], events=options['events'], attendances=options['attendances'], start=start,
+        )
+        login_users = [
+            CustomUser.objects.create_user(username=f'login{i}', email=f'login{i}@example.com', password=PASSWORD)
+            for i in range(min(10, options['requests']))
+        ]
+        attendees = CustomUser.objects.bulk_create([
+            CustomUser(username=f'attendee{i}', email=f'attendee{i}@example.com', password='!')
+            for i in range(ATTENDEES)
+        ])
+        return {
+            'start': start,
+            'events': events,
+            'upcoming': [event for event in events if event.start_date > datetime.now(timezone.utc) + timedelta(hours=1)],
+            'login_users': login_users,
+            'authorization': auth_header(users[0]),
+            'owner_authorizations': {user.pk: auth_header(user) for user in users},
+            'attendee_authorizations': [auth_header(user) for user in attendees],
+        }
+
+    def get_scenarios(self, data, options):
+        """
+        Return the scenarios: name -> (view name, request function of the request
+        index, expected status, whether the event list cache is enabled).
+        """
+        authorization = data['authorization']
+        middle = data['start'] + timedelta(hours=options['events'] // 2)
+        list_params = {
+            'list_events': {},
+            'list_events_upcoming': {'status': 'upcoming'},
+            'list_events_ongoing': {'status': 'ongoing'},
+            'list_events_past': {'status': 'past'},
+            'list_events_start_date': {'start_date': middle.date().isoformat()},
+            'list_events_end_date': {'end_date': middle.date().isoformat()},
+            'list_events_window': {'from': middle.isoformat(), 'to': (middle + timedelta(days=1)).isoformat()},
+            'list_events_search': {'q': 'room 7'},
+            'list_events_fields': {'fields': 'id,name,start_date'},
+            'list_events_attendees': {'include': 'attendees'},
+        }
+        scenarios = {
+            'register_user': ('user-register', lambda i: bench_client().post(
+                reverse('user-register'),
+                {'username': f'new{i}', 'email': f'new{i}@example.com', 'password': PASSWORD},
+            ), 201, False),
+            'login_user': ('user-login', lambda i: bench_client().post(
+                reverse('user-login'),
+                {'username': data['login_users'][i % len(data['login_users'])].username, 'password': PASSWORD},
+            ), 200, False),
+            'create_event': ('event-create', lambda i: bench_client().post(
+                reverse('event-create'),
+                {
+                    'name': f'New event {i}',
+                    'start_date': (middle + timedelta(days=1, minutes=i)).isoformat(),
+                    'end_date': (middle + timedelta(days=1, minutes=i + 60)).isoformat(),
+                    'max_capacity': 100,
+                },
+                content_type='application/json',
+                HTTP_AUTHORIZATION=authorization,
+            ), 201, False),
+        }
+        for name, params in list_params.items():
+            scenarios[name] = ('all-events', self.list_request(params, authorization), 200, False)
+        scenarios['list_events_cached'] = ('all-events', self.list_request({}, authorization), 200, True)
+
+        events = data['events']
+        upcoming = data['upcoming']
+        attendees = data['attendee_authorizations']
+        if options['requests'] > len(upcoming) * len(attendees):
+            raise CommandError('Not enough upcoming events for the registration scenarios.')
+
+        def edit(i):
+            event = events[i % len(events)]
+            return bench_client().put(
+                reverse('event-edit', args=[event.pk]), {'location': f'Room {i}'},
+                content_type='application/json', HTTP_AUTHORIZATION=data['owner_authorizations'][event.owner_id],
+            )
+
+        def registration(view):
+            # Request i (un)registers attendee i % ATTENDEES to its own upcoming event
+            def request(i):
+                event = upcoming[i // len(attendees)]
+                return bench_client().post(reverse(view, args=[event.pk]), HTTP_AUTHORIZATION=attendees[i % len(attendees)])
+            return request
+
+        scenarios['edit_event'] = ('event-edit', edit, 200, False)
+        scenarios['register_event'] = ('event-register', registration('event-register'), 200, False)
+        scenarios['unregister_event'] = ('event-unregister', registration('event-unregister'), 200, False)
+        return scenarios
+
+    def list_request(self, params, authorization):
+        def request(i):
+            return bench_client().get(reverse('all-events'), params, HTTP_AUTHORIZATION=authorization)
+        return request
+
+    def run_scenario(self, view, request, expected_status, cache, options):
+        caches = dict(settings.CACHES)
+        if not cache:
+            caches[settings.EVENT_MANAGER_CACHE] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        metrics_registry.reset()
+        with override_settings(CACHES=caches):
+            statuses, latencies, elapsed = run_concurrently(
+                lambda i: request(i).status_code, range(options['requests']), options['concurrency'],
+            )
+        # Measured by event_manager.metrics.MetricsMiddleware
+        metrics = metrics_registry.as_dict().get(view)
+        result = summarize(latencies, elapsed)
+        result['errors'] = sum(code != expected_status for code in statuses)
+        if metrics:
+            result['queries_per_request'] = metrics['db_queries']['mean']
+            result['queries_max'] = metrics['db_queries']['max']
+            result['db_ms_per_request'] = metrics['db_ms']['mean']
+            result['response_bytes'] = metrics['response_bytes']['mean']
+        return result
+
+    def compare(self, result, base):
+        """
+        Ratios of this run to a baseline run (> 1: slower latency, higher throughput, more queries).
+        """
+        def ratio(name):
+            if result.get(name) is None or not base.get(name):
+                return None
+            return result[name] / base[name]
+        return {
+            'p50_ratio': ratio('p50_ms'),
+            'p95_ratio': ratio('p95_ms'),
+            'p99_ratio': ratio('p99_ms'),
+            'throughput_ratio': ratio('throughput_per_s'),
+            'queries_ratio': ratio('queries_per_request'),
+        }
+
+    def get_meta(self, options, hasher):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'hasher': hasher,
+            **{name: options[name] for name in ('users', 'events', 'attendances', 'requests', 'concurrency')},
+        }
@@ -0,0 +1,71 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from event_manager.bench import benchmark_database, run_concurrently, summarize, write_report
+from event_manager.models import CustomUser
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark login_user: logins/sec, latency and database writes per login, '
+        'on a throw-away test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--logins', type=int, default=200, help='Total number of logins.')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument(
+            '--hasher',
+            help='Password hasher to use instead of PASSWORD_HASHERS[0] '
+                 '(e.g. django.contrib.auth.hashers.MD5PasswordHasher).',
+        )
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        hashers = list(settings.PASSWORD_HASHERS)
+        if options['hasher']:
+            hashers.insert(0, options['hasher'])
+
+        with override_settings(PASSWORD_HASHERS=hashers), benchmark_database():
+            password = 'bench-password'
+            users = [
+                CustomUser.objects.create_user(username=f'bench{i}', email=f'bench{i}@example.com', password=password)
+                for i in range(options['users'])
+            ]
+            report = self.bench(users, password, options)
+
+        report['hasher'] = hashers[0]
+        write_report(self.stdout, report, options['json'])
+
+    def bench(self, users, password, options):
+        lock = threading.Lock()
+        writes = {'count': 0}
+
+        def count_writes(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+                with lock:
+                    writes['count'] += 1
+            return execute(sql, params, many, context)
+
+        def login(i):
+            user = users[i % len(users)]
+            with connection.execute_wrapper(count_writes):
+                response = Client().post(reverse('user-login'), {'username': user.username, 'password': password})
+            return response.status_code
+
+        statuses, latencies, elapsed = run_concurrently(login, range(options['logins']), options['concurrency'])
+        summary = summarize(latencies, elapsed)
+        return {
+            'logins': summary,
+            'logins_per_s': summary.get('throughput_per_s'),
+            'db_writes_per_login': writes['count'] / len(statuses),
+            'errors': sum(code != 200 for code in statuses),
+        }
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from event_manager.bench import benchmark_database, seed, summarize, write_report
+from event_manager.filters import overlap_filter
+from event_manager.models import Event
+from event_manager.pagination import EventCursorPagination
+
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the from/to overlap filter of list_events against the plain '
+        '"start_date < to AND end_date > from" predicate, on a throw-away test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1000000)
+        parser.add_argument('--long-every', type=int, default=5000, help='One event out of N lasts weeks to years.')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs of each window per method.')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            started = time.perf_counter()
+            end = self.seed(options['events'], options['long_every'])
+            report = {'events': options['events'], 'seed_seconds': time.perf_counter() - started}
+            # Windows of a day and of a week, early, in the middle and at the end of the data
+            windows = {
+                f'{label}_{days}d': (at, at + timedelta(days=days))
+                for label, at in (('early', START + (end - START) / 10), ('middle', START + (end - START) / 2),
+                                  ('late', end - timedelta(days=8)))
+                for days in (1, 7)
+            }
+            for name, (window_start, window_end) in windows.items():
+                plain = Q(start_date__lt=window_end, end_date__gt=window_start)
+                report[name] = {
+                    'plain': self.bench(plain, options),
+                    'overlap_filter': self.bench(overlap_filter(window_start, window_end), options),
+                }
+        write_report(self.stdout, report, options['json'])
+
+    def seed(self, count, long_every, batch_size=5000):
+        """
+        Insert events 5 minutes apart lasting 1 to 5 hours, and a long one
+        (10 days to 5 years) every long_every events; return the last start.
+        """
+        rng = random.Random(0)
+        users, _ = seed(users=10, events=0)
+        for offset in range(0, count, batch_size):
+            events = []
+            for i in range(offset, min(offset + batch_size, count)):
+                start = START + timedelta(minutes=5 * i)
+                if i % long_every:
+                    duration = timedelta(hours=rng.randint(1, 5))
+                else:
+                    duration = timedelta(days=rng.randint(10, 5 * 365))
+                events.append(Event(
+                    name=f'Event {i}', start_date=start, end_date=start + duration, owner=users[i % len(users)],
+                ))
+            Event.objects.bulk_create(events)
+        return START + timedelta(minutes=5 * count)
+
+    def bench(self, condition, options):
+        events = Event.objects.filter(condition).order_by(*EventCursorPagination.ordering)
+        latencies = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            rows = list(events[:options['page_size']])
+            latencies.append(time.perf_counter() - started)
+        summary = summarize(latencies)
+        return {'rows': len(rows), 'p50_ms': summary['p50_ms'], 'p95_ms': summary['p95_ms']}
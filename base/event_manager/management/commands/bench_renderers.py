@@ -0,0 +1,68 @@
+import gzip
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from event_manager.bench import benchmark_database, seed, summarize, write_report
+from event_manager.compression import brotli
+from event_manager.models import Event
+from event_manager.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from event_manager.serializers import DEFAULT_LIST_FIELDS, EventValuesSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the render time and size on the wire (plain, gzip, Brotli) of list_events '
+        'payloads with the stdlib JSON, orjson and MessagePack renderers, on a throw-away test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--attendances', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=50, help='Renders of each payload per renderer.')
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        renderers = {'json_stdlib': JSONRenderer()}
+        if orjson is not None:
+            renderers['json_orjson'] = FastJSONRenderer()
+        if msgpack is not None:
+            renderers['msgpack'] = MessagePackRenderer()
+        report = {'renderers': list(renderers), 'brotli': brotli is not None}
+
+        with benchmark_database():
+            events = max(options['page_sizes'])
+            seed(users=100, events=events, attendances=options['attendances'])
+            for page_size in options['page_sizes']:
+                for name, fields in (('list', DEFAULT_LIST_FIELDS), ('with_attendees', DEFAULT_LIST_FIELDS + ('attendees',))):
+                    serializer = EventValuesSerializer(fields)
+                    rows = list(serializer.get_queryset(Event.objects.order_by('start_date', 'id'))[:page_size])
+                    payload = {'next': None, 'results': serializer.to_representation(rows)}
+                    report[f'{name}_{page_size}'] = {
+                        renderer_name: self.bench(renderer, payload, options['repeat'])
+                        for renderer_name, renderer in renderers.items()
+                    }
+        write_report(self.stdout, report, options['json'])
+
+    def bench(self, renderer, payload, repeat):
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            content = renderer.render(payload)
+            latencies.append(time.perf_counter() - started)
+        result = {'render_p50_ms': summarize(latencies)['p50_ms'], 'bytes': len(content)}
+        for encoding, compress in self.compressors().items():
+            started = time.perf_counter()
+            result[f'{encoding}_bytes'] = len(compress(content))
+            result[f'{encoding}_ms'] = (time.perf_counter() - started) * 1000
+        return result
+
+    def compressors(self):
+        # The settings of event_manager.compression.CompressionMiddleware
+        compressors = {'gzip': lambda content: gzip.compress(content, compresslevel=6)}
+        if brotli is not None:
+            quality = settings.EVENT_MANAGER_BROTLI_QUALITY
+            compressors['br'] = lambda content: brotli.compress(content, quality=quality)
+        return compressors
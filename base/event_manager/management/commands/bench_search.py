@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from event_manager.bench import benchmark_database, seed, summarize, write_report
+from event_manager.models import Event
+from event_manager.pagination import EventCursorPagination
+from event_manager.search import search_events, search_filter
+
+WORDS = (
+    'jazz rock opera blues folk techno concert festival workshop talk meetup conference '
+    'python django data cloud security design startup pottery painting cooking wine beer '
+    'yoga running cycling chess cinema theatre poetry science history travel photography'
+).split()
+# Long tail of rarer words, so that most queries are selective like real ones
+RARE_WORDS = [f'{word}{i}' for i in range(200) for word in ('topic', 'tag')]
+CITIES = ('Rome', 'Milan', 'Turin', 'Naples', 'Florence', 'Bologna', 'Venice', 'Genoa')
+QUERIES = ('topic17', 'tag42 rome', 'jazz topic3', 'python workshop', 'photo', 'festival milan', 'nothing')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the full-text search of list_events (FTS5, bm25 ranked) against '
+        'the icontains fallback, on a throw-away test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100000, help='Number of events to seed (e.g. 1000000).')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs of each query per method.')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('FTS5 search needs an SQLite default database.')
+        with benchmark_database():
+            started = time.perf_counter()
+            self.seed(options['events'])
+            seconds = time.perf_counter() - started
+            report = {
+                'events': options['events'],
+                'seed_seconds': seconds,
+                'fts': self.bench(self.fts_page, options),
+                'icontains': self.bench(self.icontains_page, options),
+            }
+        write_report(self.stdout, report, options['json'])
+
+    def seed(self, count, batch_size=5000):
+        rng = random.Random(0)
+        users, _ = seed(users=10, events=0)
+        start = datetime.now(timezone.utc) + timedelta(days=1)
+        for offset in range(0, count, batch_size):
+            Event.objects.bulk_create([
+                Event(
+                    name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                    description=' '.join(rng.choices(WORDS, k=10) + rng.choices(RARE_WORDS, k=3)),
+                    location=rng.choice(CITIES),
+                    start_date=start + timedelta(minutes=i),
+                    end_date=start + timedelta(minutes=i + 90),
+                    owner=users[i % len(users)],
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            ])
+
+    def fts_page(self, query, page_size):
+        return search_events(Event.objects.all(), query, limit=page_size)
+
+    def icontains_page(self, query, page_size):
+        events = Event.objects.filter(search_filter(query)).order_by(*EventCursorPagination.ordering)
+        return list(events[:page_size])
+
+    def bench(self, page, options):
+        report, latencies = {}, []
+        for query in QUERIES:
+            query_latencies = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                count = len(page(query, options['page_size']))
+                query_latencies.append(time.perf_counter() - started)
+            report[query] = {'results': count, 'p50_ms': summarize(query_latencies)['p50_ms']}
+            latencies += query_latencies
+        report['all'] = summarize(latencies)
+        return report
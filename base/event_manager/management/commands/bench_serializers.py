@@ -0,0 +1,72 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from event_manager.bench import benchmark_database, seed, summarize, write_report
+from event_manager.models import Event
+from event_manager.serializers import (
+    DEFAULT_LIST_FIELDS, EventListSerializer, EventSerializer, EventValuesSerializer, only_list_fields,
+)
+
+SPARSE_FIELDS = ('id', 'name', 'start_date')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the serialization of event lists: EventSerializer (with the attendee ids), '
+        'EventListSerializer and the values() fast path, with all and sparse fields, '
+        'on a throw-away test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=10000)
+        parser.add_argument('--attendances', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=10, help='Runs of each method.')
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed(users=100, events=options['events'], attendances=options['attendances'])
+            methods = {
+                'event_serializer': self.event_serializer,
+                'list_serializer': lambda: self.list_serializer(DEFAULT_LIST_FIELDS),
+                'values': lambda: self.values(DEFAULT_LIST_FIELDS),
+                'list_serializer_sparse': lambda: self.list_serializer(SPARSE_FIELDS),
+                'values_sparse': lambda: self.values(SPARSE_FIELDS),
+            }
+            report = {'events': options['events'], 'attendances': options['attendances']}
+            for name, method in methods.items():
+                report[name] = self.bench(method, options['repeat'])
+        write_report(self.stdout, report, options['json'])
+
+    def event_serializer(self):
+        events = list(Event.objects.with_related().order_by('start_date', 'id'))
+        return events, lambda: EventSerializer(events, many=True).data
+
+    def list_serializer(self, fields):
+        events = list(only_list_fields(Event.objects.all(), fields).order_by('start_date', 'id'))
+        return events, lambda: EventListSerializer(events, many=True, context={'fields': fields}).data
+
+    def values(self, fields):
+        serializer = EventValuesSerializer(fields)
+        rows = list(serializer.get_queryset(Event.objects.all()).order_by('start_date', 'id'))
+        return rows, lambda: serializer.to_representation(rows)
+
+    def bench(self, method, repeat):
+        """
+        Time the query (with prefetches) and the serialization of all the events.
+        """
+        query_latencies, serialize_latencies = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            _, serialize = method()
+            query_latencies.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            data = serialize()
+            serialize_latencies.append(time.perf_counter() - started)
+        return {
+            'query_p50_ms': summarize(query_latencies)['p50_ms'],
+            'serialize_p50_ms': summarize(serialize_latencies)['p50_ms'],
+            'payload_bytes': len(json.dumps(data, default=str)),
+        }
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from event_manager.bench import auth_header, benchmark_database, run_concurrently, seed, summarize, write_report
+
+# Settings of the untuned profile: journal_mode=DELETE, the 5 seconds timeout
+# of the sqlite3 module and a connection per request
+DEFAULT_PROFILE = {'pragmas': {}, 'conn_max_age': 0, 'timeout': 5}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark concurrent register_event writes on SQLite, with the default '
+        'and the tuned (EVENT_MANAGER_SQLITE_PRAGMAS, CONN_MAX_AGE) profiles, '
+        'each on a throw-away database file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=400, help='Number of users, one registration each.')
+        parser.add_argument('--events', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark needs an SQLite default database.')
+        tuned = {
+            'pragmas': settings.EVENT_MANAGER_SQLITE_PRAGMAS,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'timeout': connection.settings_dict['OPTIONS'].get('timeout', 5),
+        }
+        write_report(self.stdout, {
+            'concurrency': options['concurrency'],
+            'default': self.bench(DEFAULT_PROFILE, options),
+            'tuned': self.bench(tuned, options),
+        }, options['json'])
+
+    def bench(self, profile, options):
+        settings_dict = connection.settings_dict
+        saved = settings_dict['CONN_MAX_AGE'], dict(settings_dict['OPTIONS'])
+        # Shared by the connections of every thread
+        settings_dict['CONN_MAX_AGE'] = profile['conn_max_age']
+        settings_dict['OPTIONS']['timeout'] = profile['timeout']
+        try:
+            with override_settings(EVENT_MANAGER_SQLITE_PRAGMAS=profile['pragmas']), benchmark_database():
+                users, events = seed(users=options['users'], events=options['events'])
+                headers = [auth_header(user) for user in users]
+                close_old_connections()
+                return self.register_all(headers, events, options)
+        finally:
+            settings_dict['CONN_MAX_AGE'], settings_dict['OPTIONS'] = saved
+
+    def register_all(self, headers, events, options):
+        connections_opened = []
+
+        def register(i):
+            client = Client(raise_request_exception=False)
+            url = reverse('event-register', args=[events[i % len(events)].id])
+            new_connection = connection.connection is None
+            response = client.post(url, HTTP_AUTHORIZATION=headers[i])
+            # What the request handler does at the end of every request
+            close_old_connections()
+            connections_opened.append(new_connection)
+            return response.status_code
+
+        statuses, latencies, elapsed = run_concurrently(register, range(len(headers)), options['concurrency'])
+        summary = summarize(latencies, elapsed)
+        return {
+            'registrations': summary,
+            'writes_per_s': summary.get('throughput_per_s'),
+            'errors': sum(code != 200 for code in statuses),
+            'connections_opened': sum(connections_opened),
+        }
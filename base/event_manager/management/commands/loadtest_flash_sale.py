@@ -0,0 +1,276 @@
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import json
+import socketserver
+import sys
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+import uuid
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.urls import reverse
+
+from event_manager.bench import auth_header, benchmark_database, run_concurrently, seed, summarize, write_report
+from event_manager.metrics import registry as metrics_registry
+from event_manager.models import Event
+
+ENDPOINTS = {'sync': 'event-register', 'async': 'async-event-register'}
+LOCK_MESSAGES = ('database is locked', 'database table is locked', 'deadlock', 'could not obtain lock', 'lock wait timeout')
+
+
+def is_lock_error(text):
+    text = text.lower()
+    return any(message in text for message in LOCK_MESSAGES)
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # All the users of a flash sale connect at once
+    request_queue_size = 1024
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test a flash sale: many users registering at once to an event with a small max_capacity. '
+        'Serves the WSGI application of wsgi/event_manager.py in-process (wsgiref, throw-away test '
+        'database) or targets a running server (--url), and reports accepted and rejected '
+        'registrations, waitlisted users, overbooking, lock errors and latencies.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Users registering to each event.')
+        parser.add_argument('--capacity', type=int, default=10, help='max_capacity of the events.')
+        parser.add_argument('--rounds', type=int, default=5, help='Flash sales to run (one new event each).')
+        parser.add_argument('--concurrency', type=int, default=100, help='Concurrent client connections.')
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='sync', help='Registration endpoint.')
+        parser.add_argument(
+            '--url',
+            help='Base URL of a running server (e.g. http://127.0.0.1:8000/); users and events are '
+                 'then created through the API, with its password hasher.',
+        )
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds before a request fails.')
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['capacity'] < 1 or options['rounds'] < 1:
+            raise CommandError('--users, --capacity and --rounds must be positive.')
+        self.timeout = options['timeout']
+        if options['url']:
+            self.base_url = options['url'].rstrip('/')
+            report = self.run(self.remote_setup(options), options)
+        else:
+            with benchmark_database(), self.serve() as base_url:
+                self.base_url = base_url
+                report = self.run(self.local_setup(options), options)
+        write_report(self.stdout, report, options['json'])
+
+    @contextmanager
+    def serve(self):
+        """
+        Serve the WSGI application with wsgiref, one thread per request.
+        """
+        # Imported here: it sets DJANGO_SETTINGS_MODULE if missing
+        from wsgi.event_manager import application
+        server = make_server(
+            '127.0.0.1', 0, application, server_class=ThreadingWSGIServer, handler_class=QuietWSGIRequestHandler,
+        )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        exceptions = Counter()
+
+        def record_exception(sender, **kwargs):
+            error = sys.exc_info()[1]
+            if error is not None:
+                exceptions[f'{type(error).__name__}: {error}'] += 1
+
+        got_request_exception.connect(record_exception, weak=False)
+        self.exceptions = exceptions
+        try:
+            yield f'http://127.0.0.1:{server.server_port}'
+        finally:
+            got_request_exception.disconnect(record_exception)
+            server.shutdown()
+            server.server_close()
+
+    def local_setup(self, options):
+        """
+        Seed the users and the events in the test database.
+        """
+        users, _ = seed(users=options['users'] + 1, events=0)
+        owner, users = users[0], users[1:]
+        start = datetime.now(timezone.utc) + timedelta(days=1)
+        events = [
+            Event.objects.create(
+                name=f'Flash sale {i}', start_date=start, end_date=start + timedelta(hours=2),
+                max_capacity=options['capacity'], owner=owner,
+            ).pk
+            for i in range(options['rounds'])
+        ]
+        return {'events': events, 'authorizations': [auth_header(user) for user in users], 'owner': auth_header(owner)}
+
+    def remote_setup(self, options):
+        """
+        Create the users (register and log in) and the events through the API.
+        """
+        self.exceptions = None
+        run_id = uuid.uuid4().hex[:8]
+        password = uuid.uuid4().hex
+
+        def create_user(i):
+            username = f'flash{run_id}_{i}'
+            status, body = self.request('POST', reverse('user-register'), {
+                'username': username, 'email': f'{username}@example.com', 'password': password,
+            })
+            if status != 201:
+                raise CommandError(f'Cannot register {username}: {status} {body[:200]!r}')
+            status, body = self.request('POST', reverse('user-login'), {'username': username, 'password': password})
+            if status != 200:
+                raise CommandError(f'Cannot log in {username}: {status} {body[:200]!r}')
+            return 'Bearer ' + json.loads(body)['access_token']
+
+        authorizations, _, _ = run_concurrently(create_user, range(options['users'] + 1), min(options['concurrency'], 16))
+        owner, authorizations = authorizations[0], authorizations[1:]
+        start = datetime.now(timezone.utc) + timedelta(days=1)
+        events = []
+        for i in range(options['rounds']):
+            status, body = self.request('POST', reverse('event-create'), {
+                'name': f'Flash sale {run_id} {i}',
+                'start_date': start.isoformat(),
+                'end_date': (start + timedelta(hours=2)).isoformat(),
+                'max_capacity': options['capacity'],
+            }, owner)
+            if status != 201:
+                raise CommandError(f'Cannot create the event: {status} {body[:200]!r}')
+            events.append(json.loads(body)['id'])
+        return {'events': events, 'authorizations': authorizations, 'owner': owner}
+
+    def request(self, method, path, data=None, authorization=None):
+        """
+        Send a JSON request; return the status (None if the connection failed) and the body.
+        """
+        headers = {'Content-Type': 'application/json'}
+        if authorization:
+            headers['Authorization'] = authorization
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            return None, str(e).encode('utf-8')
+
+    def run(self, setup, options):
+        metrics_registry.reset()
+        rounds = [self.flash_sale(event_id, setup, options) for event_id in setup['events']]
+        totals = Counter()
+        latencies = []
+        for result in rounds:
+            totals.update(result['outcomes'])
+            latencies += result.pop('latencies')
+        report = {
+            'mode': 'url' if options['url'] else 'in-process',
+            'endpoint': ENDPOINTS[options['endpoint']],
+            'users': options['users'],
+            'capacity': options['capacity'],
+            'rounds': len(rounds),
+            'concurrency': options['concurrency'],
+            'outcomes': dict(totals),
+            'overbooking_incidents': sum(result['overbooked'] for result in rounds),
+            'count_mismatches': sum(result['count_mismatch'] for result in rounds),
+            'latency': summarize(latencies, sum(result['elapsed_s'] for result in rounds)),
+            'per_round': {f"event_{result.pop('event')}": result for result in rounds},
+        }
+        if self.exceptions is not None:
+            report['server_exceptions'] = dict(self.exceptions.most_common(10))
+            server_metrics = metrics_registry.as_dict().get(ENDPOINTS[options['endpoint']])
+            if server_metrics:
+                report['server'] = {
+                    'queries_per_request': server_metrics['db_queries']['mean'],
+                    'db_ms_per_request': server_metrics['db_ms']['mean'],
+                    'wall_ms_p95': server_metrics['wall_ms']['p95'],
+                }
+        return report
+
+    def flash_sale(self, event_id, setup, options):
+        """
+        Register all the users to an event at once, then check its attendees.
+        """
+        path = reverse(ENDPOINTS[options['endpoint']], args=[event_id])
+        exceptions_before = Counter(self.exceptions) if self.exceptions is not None else None
+
+        def register(authorization):
+            return self.request('POST', path, authorization=authorization)
+
+        responses, latencies, elapsed = run_concurrently(register, setup['authorizations'], options['concurrency'])
+        outcomes = Counter(self.classify(status, body) for status, body in responses)
+        if exceptions_before is not None:
+            # In-process, the server exceptions tell the lock errors apart
+            lock_errors = sum(
+                count for message, count in (self.exceptions - exceptions_before).items() if is_lock_error(message)
+            )
+            lock_errors = min(lock_errors, outcomes['server_errors'])
+            outcomes['lock_errors'] += lock_errors
+            outcomes['server_errors'] -= lock_errors
+
+        attendees, attendee_count = self.get_attendees(event_id, setup['owner'])
+        return {
+            'event': event_id,
+            'outcomes': dict(+outcomes),
+            'attendees': attendees,
+            'attendee_count': attendee_count,
+            'overbooked': outcomes['accepted'] > options['capacity'] or attendees > options['capacity'],
+            'count_mismatch': attendee_count is not None and attendee_count != attendees,
+            'elapsed_s': elapsed,
+            'latencies': latencies,
+        }
+
+    def classify(self, status, body):
+        if status is None:
+            return 'connection_errors'
+        if status >= 500:
+            return 'lock_errors' if is_lock_error(body.decode('utf-8', 'replace')) else 'server_errors'
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = {}
+        if status == 200 and data.get('success'):
+            return 'accepted'
+        if status == 200:
+            # Event full
+            return 'rejected'
+        if status == 202 and data.get('waitlisted'):
+            return 'waitlisted'
+        if status == 400 and 'already registered' in data.get('error', ''):
+            return 'duplicates'
+        return f'status_{status}'
+
+    def get_attendees(self, event_id, owner):
+        """
+        Return the number of attendees of an event, and its attendee_count (in-process only).
+        """
+        if self.exceptions is not None:
+            event = Event.objects.get(pk=event_id)
+            return event.attendees.count(), event.attendee_count
+        attendees = 0
+        url = f'{reverse("event-attendees", args=[event_id])}?page_size=1000'
+        while url:
+            status, body = self.request('GET', url, authorization=owner)
+            if status != 200:
+                raise CommandError(f'Cannot list the attendees: {status} {body[:200]!r}')
+            data = json.loads(body)
+            attendees += len(data['results'])
+            # Follow the next link on the base URL
+            url = urlsplit(data['next'])._replace(scheme='', netloc='').geturl() if data['next'] else None
+        return attendees, None
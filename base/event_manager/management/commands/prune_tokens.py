@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from event_manager.tokens import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired outstanding and blacklisted JWTs in bounded batches. '
+        'Safe to run while serving traffic (e.g. from cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per transaction.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches per table.')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        result = prune_expired_tokens(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            pause=options['pause'],
+        )
+        self.stdout.write(
+            'Removed {blacklisted} blacklisted and {outstanding} outstanding tokens in {seconds:.3f}s'.format(**result)
+        )
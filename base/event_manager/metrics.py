@@ -0,0 +1,304 @@
+"""
+Per-request performance instrumentation.
+
+MetricsMiddleware measures each request: wall time, number and time of the
+database queries (through an execute wrapper installed on every connection),
+serializer and renderer time (see timed) and response bytes. Each response gets
+a Server-Timing header, and the measures are aggregated per view in bucketed
+histograms of this process, served by the metrics endpoint.
+
+Slow queries (EVENT_MANAGER_SLOW_QUERY_MS) are sampled to the event_manager
+logger. The overhead is a few counter updates per query and per request.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger('event_manager')
+
+# Upper bounds of the histogram buckets (the last bucket is unbounded)
+MILLISECONDS_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """
+    Bucketed histogram: constant memory, and percentiles estimated by the upper
+    bound of their bucket (the maximum for the last one). Not thread safe, see
+    MetricsRegistry.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': {
+                **{str(bound): count for bound, count in zip(self.bounds, self.counts)},
+                '+Inf': self.counts[-1],
+            },
+        }
+
+
+class ViewMetrics:
+    """
+    Histograms of the requests to a view.
+    """
+
+    def __init__(self):
+        self.statuses = {}
+        self.histograms = {
+            'wall_ms': Histogram(MILLISECONDS_BUCKETS),
+            'db_queries': Histogram(QUERIES_BUCKETS),
+            'db_ms': Histogram(MILLISECONDS_BUCKETS),
+            'serialize_ms': Histogram(MILLISECONDS_BUCKETS),
+            'render_ms': Histogram(MILLISECONDS_BUCKETS),
+            'response_bytes': Histogram(BYTES_BUCKETS),
+        }
+
+    def observe(self, status, measures):
+        status_class = f'{status // 100}xx'
+        self.statuses[status_class] = self.statuses.get(status_class, 0) + 1
+        for name, value in measures.items():
+            self.histograms[name].observe(value)
+
+    def as_dict(self):
+        return {
+            'requests': sum(self.statuses.values()),
+            'statuses': dict(self.statuses),
+            **{name: histogram.as_dict() for name, histogram in self.histograms.items()},
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread safe per-view metrics of this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, status, measures):
+        with self._lock:
+            if view not in self.views:
+                self.views[view] = ViewMetrics()
+            self.views[view].observe(status, measures)
+
+    def as_dict(self):
+        with self._lock:
+            return {view: metrics.as_dict() for view, metrics in sorted(self.views.items())}
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    Measures of the request being served.
+    """
+    __slots__ = ('path', 'started', 'queries', 'db_time', 'timings')
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = {'serialize': 0.0, 'render': 0.0}
+
+    def measures(self, response_bytes):
+        return {
+            'wall_ms': (time.perf_counter() - self.started) * 1000,
+            'db_queries': self.queries,
+            'db_ms': self.db_time * 1000,
+            'serialize_ms': self.timings['serialize'] * 1000,
+            'render_ms': self.timings['render'] * 1000,
+            'response_bytes': response_bytes,
+        }
+
+    def server_timing(self):
+        total = (time.perf_counter() - self.started) * 1000
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.timings["serialize"] * 1000:.1f}',
+            f'render;dur={self.timings["render"] * 1000:.1f}',
+            f'total;dur={total:.1f}',
+        ])
+
+
+_current = ContextVar('event_manager_request_metrics', default=None)
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to the ``name`` timing ('serialize' or
+    'render') of the current request, if any.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - started
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper counting the queries of the current request, and sampling
+    slow queries to the event_manager logger.
+    """
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.db_time += duration
+        if (duration * 1000 >= settings.EVENT_MANAGER_SLOW_QUERY_MS
+                and random.random() < settings.EVENT_MANAGER_SLOW_QUERY_SAMPLE_RATE):
+            logger.warning(
+                'Slow query: %.1f ms on %s (%s): %s',
+                duration * 1000, context['connection'].alias, metrics.path if metrics else '-', sql,
+            )
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    connection_created handler installing record_query on the connection.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
+
+
+def count_stream(content, metrics, observe):
+    """
+    Iterate over streamed content with the request metrics active, and record
+    them with the streamed bytes once the stream ends.
+    """
+    iterator = iter(content)
+    size = 0
+    while True:
+        token = _current.set(metrics)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            _current.reset(token)
+        size += len(chunk)
+        yield chunk
+    observe(size)
+
+
+async def acount_stream(content, metrics, observe):
+    """
+    Async version of count_stream.
+    """
+    iterator = aiter(content)
+    size = 0
+    while True:
+        token = _current.set(metrics)
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            break
+        finally:
+            _current.reset(token)
+        size += len(chunk)
+        yield chunk
+    observe(size)
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    """
+    Measure each request, add the Server-Timing header to its response and
+    record its measures under its view name.
+    """
+    def finish(request, metrics, response):
+        view = get_view_name(request)
+
+        def observe(response_bytes):
+            registry.observe(view, response.status_code, metrics.measures(response_bytes))
+
+        if settings.EVENT_MANAGER_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing()
+        if not response.streaming:
+            observe(len(response.content))
+        elif response.is_async:
+            response.streaming_content = acount_stream(response.streaming_content, metrics, observe)
+        else:
+            response.streaming_content = count_stream(response.streaming_content, metrics, observe)
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics = RequestMetrics(request.path)
+            token = _current.set(metrics)
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return finish(request, metrics, response)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            metrics = RequestMetrics(request.path)
+            token = _current.set(metrics)
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return finish(request, metrics, response)
+    return middleware
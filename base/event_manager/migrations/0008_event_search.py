@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:40
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from event_manager.search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from event_manager.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0007_event_updated_at'),
+    ]
+
+    operations = [
+        # SQLite only: FTS5 index of the events, kept in sync by triggers
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 22:05
+
+import event_manager.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event_manager', '0008_event_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='duration',
+            field=models.GeneratedField(db_persist=True, expression=event_manager.models.DurationSeconds('start_date', 'end_date'), output_field=models.FloatField()),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['duration', 'start_date', 'end_date'], name='event_duration_idx'),
+        ),
+    ]
@@ -1,8 +1,13 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError, NotSupportedError
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
 from django.contrib.auth.models import AbstractUser
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.core.validators import MinValueValidator
 
+from .cache import invalidate_event_list_on_commit
+
 class CustomUser(AbstractUser):
     def generate_tokens(self):
         refresh = RefreshToken.for_user(self)
@@ -10,7 +15,97 @@ class CustomUser(AbstractUser):
         return str(access), str(refresh) # TODO need cast to str?
     def __str__(self):
         return self.email
-    
+
+
+class AlreadyRegistered(Exception):
+    """
+    The user is already registered to the event.
+    """
+
+
+class EventFull(Exception):
+    """
+    The event has reached its maximum capacity.
+    """
+
+
+class AlreadyWaitlisted(Exception):
+    """
+    The user is already on the waitlist of the event.
+    """
+
+
+class ScheduleConflict(Exception):
+    """
+    The event overlaps events the user attends (``conflicts``).
+    """
+
+    def __init__(self, conflicts):
+        super().__init__(conflicts)
+        self.conflicts = conflicts
+
+
+class DurationSeconds(models.Func):
+    """
+    Number of seconds from a start to an end datetime, with database functions
+    allowed in generated columns and indexes.
+    """
+    arity = 2
+    output_field = models.FloatField()
+
+    def compile_bounds(self, compiler):
+        start, start_params = compiler.compile(self.source_expressions[0])
+        end, end_params = compiler.compile(self.source_expressions[1])
+        return start, end, (*end_params, *start_params)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        start, end, params = self.compile_bounds(compiler)
+        return f'((julianday({end}) - julianday({start})) * 86400)', params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        start, end, params = self.compile_bounds(compiler)
+        return f'EXTRACT(EPOCH FROM ({end} - {start}))', params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f'DurationSeconds is not implemented on {connection.vendor}')
+
+
+class EventQuerySet(models.QuerySet):
+    def with_related(self, attendees=True):
+        """
+        Select the owner and batch-prefetch the attendee ids (unless attendees
+        is False), so that serializing a list of events runs a constant number
+        of queries.
+        """
+        events = self.select_related('owner')
+        if attendees:
+            events = events.prefetch_related(models.Prefetch('attendees', queryset=CustomUser.objects.only('id')))
+        return events
+
+    def attended_overlapping(self, user, start, end):
+        """
+        Filter the events attended by a user overlapping [start, end).
+
+        The query is driven by the user's rows of the attendees table (indexed
+        by user), so it never reads the events the user does not attend.
+        """
+        return self.filter(attendees=user, start_date__lt=end, end_date__gt=start)
+
+    def refresh_attendee_counts(self):
+        """
+        Recompute the denormalized attendee_count of the events from the attendees table.
+        """
+        counts = (
+            self.model.attendees.through.objects
+            .filter(event=OuterRef('pk'))
+            .order_by()
+            .values('event')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        return self.update(attendee_count=Coalesce(Subquery(counts), 0), updated_at=now())
+
+
 class Event(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
@@ -20,6 +115,213 @@ class Event(models.Model):
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='events_owned')
     max_capacity = models.PositiveIntegerField(validators=[MinValueValidator(1)], blank=True, null=True)
     location = models.CharField(max_length=255, blank=True, null=True)
-    
+    # Denormalized number of attendees, kept in sync by add_attendee/remove_attendee
+    attendee_count = models.PositiveIntegerField(default=0, editable=False)
+    # Last change to the event, used for the ETag validator of the event lists
+    updated_at = models.DateTimeField(auto_now=True)
+    # Seconds from start to end, kept by the database (see filters.overlap_filter)
+    duration = models.GeneratedField(
+        expression=DurationSeconds('start_date', 'end_date'),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # upcoming status, start_date filter and (start_date, id) pagination
+            models.Index(fields=['start_date', 'id'], name='event_start_idx'),
+            # past and ongoing status, end_date filter
+            models.Index(fields=['end_date', 'start_date'], name='event_end_idx'),
+            # events of a user, paginated by (start_date, id)
+            models.Index(fields=['owner', 'start_date', 'id'], name='event_owner_start_idx'),
+            # long events of the from/to overlap filter
+            models.Index(fields=['duration', 'start_date', 'end_date'], name='event_duration_idx'),
+        ]
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+    def get_conflicts(self, user):
+        """
+        Return the ids of the other events attended by a user that overlap this one.
+        """
+        events = Event.objects.attended_overlapping(user, self.start_date, self.end_date).exclude(pk=self.pk)
+        return list(events.order_by('start_date', 'id').values_list('id', flat=True))
+
+    def add_attendee(self, user, reject_conflicts=False, waitlist=False):
+        """
+        Register a user to the event, enforcing max_capacity.
+
+        The membership row and the counter are written in one transaction, and the
+        counter is only incremented while it is below max_capacity
+        (``UPDATE ... WHERE attendee_count < max_capacity``), so concurrent
+        registrations can never overbook the event.
+
+        Args:
+            user (CustomUser): The user to register.
+            reject_conflicts (bool): Refuse the registration if the event overlaps
+                events the user attends (checked in the same transaction).
+            waitlist (bool): Put the user on the waitlist if the event is full.
+
+        Returns:
+            WaitlistEntry: The waitlist entry of the user if the event was full
+            and waitlist is set, else None.
+
+        Raises:
+            AlreadyRegistered: If the user is already registered to the event.
+            AlreadyWaitlisted: If waitlist is set and the user is already on the waitlist.
+            EventFull: If the event has reached its maximum capacity (and waitlist is not set).
+            ScheduleConflict: If reject_conflicts is set and the event overlaps
+                events the user attends.
+        """
+        try:
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        Event.attendees.through.objects.create(event_id=self.pk, customuser_id=user.pk)
+                        if reject_conflicts:
+                            conflicts = self.get_conflicts(user)
+                            if conflicts:
+                                raise ScheduleConflict(conflicts)
+                        seats = Event.objects.filter(pk=self.pk).filter(
+                            Q(max_capacity__isnull=True) | Q(attendee_count__lt=F('max_capacity'))
+                        )
+                        if not seats.update(attendee_count=F('attendee_count') + 1, updated_at=now()):
+                            raise EventFull()
+                except EventFull:
+                    if not waitlist:
+                        raise
+                    # Still in the transaction that tried the insert, which
+                    # holds the write lock: no seat can be freed meanwhile
+                    return self.join_waitlist(user)
+                invalidate_event_list_on_commit()
+        except IntegrityError:
+            raise AlreadyRegistered()
+
+    def join_waitlist(self, user):
+        """
+        Put a user at the end of the waitlist of the event.
+
+        Returns:
+            WaitlistEntry: The entry of the user.
+
+        Raises:
+            AlreadyWaitlisted: If the user is already on the waitlist.
+        """
+        try:
+            with transaction.atomic():
+                # Lock the event row, so that concurrent joins get distinct positions
+                # (SQLite locks the whole database on the first write instead)
+                list(Event.objects.select_for_update().filter(pk=self.pk).values_list('pk'))
+                tail = self.waitlist.aggregate(tail=Max('position'))['tail'] or 0
+                return WaitlistEntry.objects.create(event_id=self.pk, user_id=user.pk, position=tail + 1)
+        except IntegrityError:
+            raise AlreadyWaitlisted()
+
+    def leave_waitlist(self, user):
+        """
+        Remove a user from the waitlist of the event.
+
+        Returns:
+            bool: False if the user was not on the waitlist.
+        """
+        deleted, _ = self.waitlist.filter(user_id=user.pk).delete()
+        return bool(deleted)
+
+    def promote_waitlist(self):
+        """
+        Give the free seats of the event to the head of its waitlist, in order.
+
+        Each promotion moves the first entry to the attendees with the same
+        conditional counter update as add_attendee, so it can never overbook.
+        The transaction starts with that update: on SQLite, a transaction that
+        reads first fails at once with "database is locked" (without waiting
+        for the busy timeout) when it writes after another writer committed.
+
+        Returns:
+            list: The ids of the promoted users.
+        """
+        promoted = []
+        with transaction.atomic():
+            while True:
+                # One seat at a time (usually a single seat was freed), taken
+                # only if someone is waiting for it
+                seats = Event.objects.filter(pk=self.pk).filter(
+                    Q(max_capacity__isnull=True) | Q(attendee_count__lt=F('max_capacity')),
+                    Exists(WaitlistEntry.objects.filter(event_id=OuterRef('pk'))),
+                )
+                if not seats.update(attendee_count=F('attendee_count') + 1, updated_at=now()):
+                    break
+                entry = self.waitlist.order_by('position').first()
+                entry.delete()
+                try:
+                    with transaction.atomic():
+                        Event.attendees.through.objects.create(event_id=self.pk, customuser_id=entry.user_id)
+                except IntegrityError:
+                    # Registered meanwhile (after max_capacity was raised): give the seat back
+                    Event.objects.filter(pk=self.pk).update(attendee_count=F('attendee_count') - 1)
+                    continue
+                promoted.append(entry.user_id)
+            if promoted:
+                invalidate_event_list_on_commit()
+        return promoted
+
+    def get_registration_status(self, user):
+        """
+        Return the registration status of a user: 'registered', 'waitlisted'
+        (with the place in line, 1 for the head of the waitlist) or None.
+        """
+        if Event.attendees.through.objects.filter(event_id=self.pk, customuser_id=user.pk).exists():
+            return 'registered', None
+        entry = self.waitlist.filter(user_id=user.pk).only('event_id', 'position').first()
+        if entry is None:
+            return None, None
+        return 'waitlisted', entry.get_place()
+
+    def remove_attendee(self, user):
+        """
+        Unregister a user from the event, and give the seat to the head of the
+        waitlist in the same transaction.
+
+        Args:
+            user (CustomUser): The user to unregister.
+
+        Returns:
+            bool: False if the user was not registered to the event.
+        """
+        with transaction.atomic():
+            deleted, _ = Event.attendees.through.objects.filter(event_id=self.pk, customuser_id=user.pk).delete()
+            if deleted:
+                Event.objects.filter(pk=self.pk).update(attendee_count=F('attendee_count') - 1, updated_at=now())
+                invalidate_event_list_on_commit()
+                self.promote_waitlist()
+        return bool(deleted)
+
+
+class WaitlistEntry(models.Model):
+    """
+    A user waiting for a seat of a full event; the lowest position is served first.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='waitlist')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='waitlist_entries')
+    position = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Also the (event, position) index of the FIFO order and of the places in line
+            models.UniqueConstraint(fields=['event', 'position'], name='waitlist_event_position_unique'),
+            models.UniqueConstraint(fields=['event', 'user'], name='waitlist_event_user_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} waiting for {self.event} ({self.position})'
+
+    def get_place(self):
+        """
+        Return the place of the entry in line, 1 for the head of the waitlist.
+        """
+        # Range count on the (event, position) index
+        return WaitlistEntry.objects.filter(event_id=self.event_id, position__lte=self.position).count()
@@ -0,0 +1,180 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .search import search_events
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique, totally ordered key.
+
+    Each page is fetched with a ``WHERE key > last_key ORDER BY key LIMIT n``
+    query, so deep pages cost the same as the first one (unlike OFFSET
+    pagination). The cursor is an opaque url-safe token holding the key of
+    the last row of the previous page.
+
+    Subclasses set ``ordering`` to the tuple of fields forming the key; the
+    last field must be unique.
+    """
+    ordering = ('id',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = settings.EVENT_MANAGER_PAGE_SIZE
+        max_page_size = settings.EVENT_MANAGER_MAX_PAGE_SIZE
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            pass
+        return max(1, min(page_size, max_page_size))
+
+    def encode_cursor(self, position):
+        """
+        Encode a key tuple into an opaque cursor string.
+        """
+        raw = json.dumps([str(value) for value in position]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request, model):
+        """
+        Decode the cursor of the request into a key tuple, or None for the first page.
+
+        Raises:
+            NotFound: If the cursor is malformed.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            values = json.loads(raw.decode('utf-8'))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return tuple(self.to_python(model, name, value) for name, value in zip(self.ordering, values))
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, model, name, value):
+        """
+        Convert a value of a decoded cursor to the type of its ordering field.
+        """
+        return model._meta.get_field(name).to_python(value)
+
+    def get_position(self, item):
+        """
+        Return the key tuple of a page item (model instance or values() dict).
+        """
+        if isinstance(item, dict):
+            return tuple(item[name] for name in self.ordering)
+        return tuple(getattr(item, name) for name in self.ordering)
+
+    def get_position_filter(self, position):
+        """
+        Build the "key > position" predicate.
+
+        The leading ``first >= value`` term gives the database a range start
+        on the index, the disjunction then skips the rows of the last page.
+        """
+        after = Q()
+        for index, name in enumerate(self.ordering):
+            term = Q(**{name + '__gt': position[index]})
+            for prev_name, prev_value in zip(self.ordering[:index], position[:index]):
+                term &= Q(**{prev_name: prev_value})
+            after |= term
+        return Q(**{self.ordering[0] + '__gte': position[0]}) & after
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Return the queryset of the requested page, with one extra row to know
+        whether there is a next page.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        """
+        Trim the rows fetched with get_page_queryset to the page, and remember the next position.
+        """
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async version of paginate_queryset, for views running on the event loop.
+        """
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class EventCursorPagination(KeysetPagination):
+    """
+    Keyset pagination for events, ordered by ``(start_date, id)``.
+    """
+    ordering = ('start_date', 'id')
+
+
+class AttendeePagination(KeysetPagination):
+    """
+    Keyset pagination for the attendees of an event, ordered by ``id``.
+    """
+    ordering = ('id',)
+
+
+class EventSearchPagination(KeysetPagination):
+    """
+    Keyset pagination of full-text search results, ordered by ``(rank, id)``
+    (best match first, see event_manager.search).
+    """
+    ordering = ('rank', 'id')
+
+    def to_python(self, model, name, value):
+        if name == 'rank':
+            return float(value)
+        return super().to_python(model, name, value)
+
+    def paginate_search(self, queryset, query, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        return self.set_page(search_events(queryset, query, position, self.page_size + 1))
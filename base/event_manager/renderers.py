@@ -0,0 +1,71 @@
+"""
+Faster renderers of the API responses.
+
+FastJSONRenderer renders with orjson when it is installed, and falls back to the
+stdlib JSON encoder of DRF's JSONRenderer otherwise; both produce the same
+compact output. MessagePackRenderer answers ``Accept: application/msgpack``
+requests (only enabled when msgpack is installed, see REST_FRAMEWORK).
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+from .metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def encode_default(obj):
+    """
+    Convert the values orjson and msgpack do not encode (or, for datetimes,
+    encode differently) like DRF's JSONEncoder: lazy strings, decimals, dates
+    (ISO 8601, with a Z for UTC), querysets...
+    """
+    return encoders.JSONEncoder().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer using orjson, with the output of the compact stdlib renderer.
+
+    Indented output (``Accept: application/json; indent=4``) and the non-default
+    COMPACT_JSON/UNICODE_JSON settings fall back to the stdlib renderer.
+    """
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with timed('render'):
+            indent = self.get_indent(accepted_media_type, renderer_context or {})
+            if orjson is None or indent or self.ensure_ascii or not self.compact:
+                return super().render(data, accepted_media_type, renderer_context)
+            ret = orjson.dumps(data, default=encode_default, option=self.options)
+            # Like JSONRenderer: these are valid JSON, but not valid JavaScript
+            if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+                ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+            return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer of application/msgpack responses (needs msgpack).
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with timed('render'):
+            return msgpack.packb(data, default=encode_default, use_bin_type=True)
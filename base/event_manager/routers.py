@@ -0,0 +1,150 @@
+"""
+Read replica routing.
+
+Writes always go to the primary ('default') database. Reads go to one of the
+EVENT_MANAGER_DATABASE_REPLICAS aliases (the same for all the reads of a
+request) only inside views decorated with read_from_replica, and only if the
+request has not written yet: once a request writes, ReplicaRoutingMiddleware
+pins the client to the primary with a cookie for EVENT_MANAGER_REPLICA_PIN_SECONDS,
+so users read their own writes while the replicas catch up.
+"""
+from contextvars import ContextVar
+import functools
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+# Cookie pinning a client to the primary after a write
+PIN_COOKIE = 'event_manager_primary'
+
+
+class RoutingState:
+    """
+    Database routing state of the current request.
+    """
+
+    def __init__(self, pinned=False):
+        # Read from the primary: the client wrote recently
+        self.pinned = pinned
+        # Set by read_from_replica
+        self.use_replica = False
+        self.wrote = False
+        # Chosen on the first read: all the reads of a request see the same
+        # replica, so they are consistent with one another
+        self.replica = None
+
+    def read_alias(self):
+        replicas = settings.EVENT_MANAGER_DATABASE_REPLICAS
+        if replicas and self.use_replica and not (self.pinned or self.wrote):
+            if self.replica is None:
+                self.replica = random.choice(replicas)
+            return self.replica
+        return None
+
+
+_state = ContextVar('event_manager_routing_state', default=None)
+
+
+def pinned_to_primary():
+    """
+    Whether the current request reads from the primary (instead of the
+    configured replicas) to see its own writes.
+    """
+    state = _state.get()
+    return bool(settings.EVENT_MANAGER_DATABASE_REPLICAS) and state is not None and (state.pinned or state.wrote)
+
+
+def reads_from_replica():
+    """
+    Whether the reads of the current request go to a replica.
+    """
+    state = _state.get()
+    return state is not None and state.read_alias() is not None
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of read_from_replica views to the replicas.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            return state.read_alias() or 'default'
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.EVENT_MANAGER_DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary
+        if db in settings.EVENT_MANAGER_DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def read_from_replica(view):
+    """
+    Let the reads of a (sync or async) view go to the read replicas.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            state = _state.get()
+            if state is not None:
+                state.use_replica = True
+            return await view(request, *args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = _state.get()
+            if state is not None:
+                state.use_replica = True
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+@sync_and_async_middleware
+def ReplicaRoutingMiddleware(get_response):
+    """
+    Track the database routing state of each request, and pin clients that wrote
+    to the primary database.
+    """
+    def pin(state, response):
+        if state.wrote and settings.EVENT_MANAGER_DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.EVENT_MANAGER_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+            token = _state.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                _state.reset(token)
+            return pin(state, response)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+            token = _state.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                _state.reset(token)
+            return pin(state, response)
+    return middleware
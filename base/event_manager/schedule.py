@@ -0,0 +1,43 @@
+import heapq
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import serializers
+
+# Fields of a schedule entry, besides overlaps
+SCHEDULE_FIELDS = ('id', 'name', 'start_date', 'end_date', 'location')
+
+
+def iter_schedule(events):
+    """
+    Iterate over events in (start_date, id) order, marking their overlaps.
+
+    A sweep line keeps the events that have not ended yet in a heap ordered by
+    end date: each entry gets in ``overlaps`` the ids of the earlier events it
+    overlaps, so a conflicting pair is reported once, on the later event.
+    Events are read in chunks, and memory only grows with the number of
+    simultaneous events.
+    """
+    datetime_field = serializers.DateTimeField()
+    rows = events.order_by('start_date', 'id').values_list(*SCHEDULE_FIELDS)
+    active = []
+    for row in rows.iterator(chunk_size=settings.EVENT_MANAGER_EXPORT_CHUNK_SIZE):
+        entry = dict(zip(SCHEDULE_FIELDS, row))
+        while active and active[0][0] <= entry['start_date']:
+            heapq.heappop(active)
+        entry['overlaps'] = sorted(pk for _, pk in active)
+        heapq.heappush(active, (entry['end_date'], entry['id']))
+        entry['start_date'] = datetime_field.to_representation(entry['start_date'])
+        entry['end_date'] = datetime_field.to_representation(entry['end_date'])
+        yield entry
+
+
+def stream_schedule(events):
+    """
+    Stream the schedule of the events as a JSON array.
+    """
+    yield '['
+    for index, entry in enumerate(iter_schedule(events)):
+        yield (',' if index else '') + json.dumps(entry, cls=DjangoJSONEncoder)
+    yield ']\n'
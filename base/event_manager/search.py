@@ -0,0 +1,168 @@
+"""
+Full-text search over the name, description and location of events.
+
+On SQLite, an FTS5 table indexes the events; triggers on the event table keep
+it in sync with every insert, update and delete (including bulk_create and raw
+SQL). Matches are ranked with bm25 and paginated by (rank, id), so a search
+only reads the index instead of scanning the events. Other databases fall back
+to an icontains filter.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+from .filters import InvalidFilter
+
+FTS_TABLE = 'event_manager_event_fts'
+EVENT_TABLE = 'event_manager_event'
+SEARCH_FIELDS = ('name', 'description', 'location')
+# bm25 weights of the SEARCH_FIELDS: a match in the name counts most
+WEIGHTS = (10.0, 1.0, 5.0)
+MAX_TERMS = 10
+
+TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {EVENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description, location)
+            VALUES (new.id, new.name, new.description, new.location);
+        END""",
+    f'{FTS_TABLE}_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {EVENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, location)
+            VALUES ('delete', old.id, old.name, old.description, old.location);
+        END""",
+    f'{FTS_TABLE}_update': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF name, description, location ON {EVENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, location)
+            VALUES ('delete', old.id, old.name, old.description, old.location);
+            INSERT INTO {FTS_TABLE}(rowid, name, description, location)
+            VALUES (new.id, new.name, new.description, new.location);
+        END""",
+}
+
+
+def fts_available(alias):
+    return connections[alias].vendor == 'sqlite'
+
+
+def install_search_index(connection):
+    """
+    Create the FTS5 table and its triggers if missing (SQLite only).
+
+    Django rebuilds SQLite tables for some schema changes, which drops their
+    triggers: this is also run after every migrate, and rebuilds the index when
+    a trigger had to be recreated.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{', '.join(SEARCH_FIELDS)}, content='{EVENT_TABLE}', content_rowid='id', "
+            f"tokenize='porter unicode61 remove_diacritics 2')"
+        )
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [EVENT_TABLE])
+        existing = {name for name, in cursor.fetchall()}
+        missing = [sql for name, sql in TRIGGERS.items() if name not in existing]
+        for sql in missing:
+            cursor.execute(sql)
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_search_index(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def install_search_index_after_migrate(sender, using, **kwargs):
+    """
+    post_migrate handler re-creating the triggers dropped by table rebuilds.
+    """
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and EVENT_TABLE in connection.introspection.table_names():
+        install_search_index(connection)
+
+
+def get_terms(query):
+    """
+    Split a search query into words.
+
+    Raises:
+        InvalidFilter: If the query has no word.
+    """
+    terms = re.findall(r'\w+', query)[:MAX_TERMS]
+    if not terms:
+        raise InvalidFilter('Invalid search query')
+    return terms
+
+
+def match_expression(query):
+    """
+    Build the FTS5 MATCH expression of a query: every word must match, the
+    last one as a prefix (search as you type). Words are quoted, so the FTS5
+    query syntax (operators, columns) is never interpreted.
+    """
+    terms = get_terms(query)
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def search_filter(query):
+    """
+    Fallback icontains filter of the databases without FTS5.
+    """
+    condition = Q()
+    for term in get_terms(query):
+        condition &= Q(name__icontains=term) | Q(description__icontains=term) | Q(location__icontains=term)
+    return condition
+
+
+def search_events(events, query, after=None, limit=100):
+    """
+    Return the events of a queryset matching a search query, best first.
+
+    Args:
+        events (QuerySet): The events to search (filters are kept).
+        query (str): The search query.
+        after (tuple): Optional (rank, id) of the last event of the previous page.
+        limit (int): Maximum number of events.
+
+    Returns:
+        list: The events, ordered by (rank, id); each has a ``rank`` attribute
+        (bm25 score, lower is better).
+    """
+    alias = events.db
+    params = [match_expression(query)]
+    condition = ''
+    if events.query.where:
+        # Only index entries of the events left by the other filters
+        subquery, subquery_params = events.values('id').query.get_compiler(using=alias).as_sql()
+        condition = f' AND rowid IN ({subquery})'
+        params.extend(subquery_params)
+    weights = ', '.join(str(weight) for weight in WEIGHTS)
+    sql = (
+        f'SELECT id, score FROM ('
+        f'SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s{condition})'
+    )
+    if after is not None:
+        sql += ' WHERE score > %s OR (score = %s AND id > %s)'
+        params.extend([after[0], after[0], after[1]])
+    sql += ' ORDER BY score, id LIMIT %s'
+    params.append(limit)
+
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, params)
+        ranks = dict(cursor.fetchall())
+    found = events.order_by().in_bulk(list(ranks))
+    page = []
+    for pk, rank in ranks.items():
+        if pk in found:
+            found[pk].rank = rank
+            page.append(found[pk])
+    return page
@@ -1,4 +1,7 @@
+from django.conf import settings
+from django.utils.timezone import get_current_timezone
 from rest_framework import serializers
+from .filters import InvalidFilter
 from .models import CustomUser, Event
 # import the logging library
 import logging
@@ -43,7 +46,182 @@ class EventSerializer(serializers.ModelSerializer):
         if data['end_date'] <= data['start_date']:
             raise serializers.ValidationError("End date must be after start date.")
         return data
-    
+
+
+class BulkEventSerializer(serializers.ListSerializer):
+    """
+    List serializer of the events of a bulk creation.
+
+    Keeps the validated data of the valid events in ``valid_items`` even when
+    other events are invalid, so that they are not validated twice.
+    """
+
+    def to_internal_value(self, data):
+        self.valid_items = []
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        validated = super().run_child_validation(data)
+        self.valid_items.append(validated)
+        return validated
+
+
+class EventListSerializer(EventSerializer):
+    """
+    Compact representation of the events of list responses.
+
+    Events carry the denormalized attendee_count and the spots left instead of
+    the attendee ids. The ``fields`` of the context (see list_fields) select the
+    fields to serialize; by default all but the attendees, which are served
+    paginated by event_attendees.
+    """
+    attendee_count = serializers.IntegerField(read_only=True)
+    spots_left = serializers.SerializerMethodField()
+
+    class Meta(EventSerializer.Meta):
+        fields = EventSerializer.Meta.fields + ('attendee_count', 'spots_left')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields', DEFAULT_LIST_FIELDS)
+        return {name: field for name, field in fields.items() if name in selected}
+
+    def get_spots_left(self, event):
+        return spots_left(event.max_capacity, event.attendee_count)
+
+
+DEFAULT_LIST_FIELDS = tuple(name for name in EventListSerializer.Meta.fields if name != 'attendees')
+
+# Columns read to serialize each field of EventListSerializer
+LIST_FIELD_COLUMNS = {
+    'id': ('id',),
+    'name': ('name',),
+    'description': ('description',),
+    'start_date': ('start_date',),
+    'end_date': ('end_date',),
+    'max_capacity': ('max_capacity',),
+    'location': ('location',),
+    'attendees': (),
+    'owner': ('owner__username',),
+    'attendee_count': ('attendee_count',),
+    'spots_left': ('max_capacity', 'attendee_count'),
+}
+
+
+def spots_left(max_capacity, attendee_count):
+    # None: the event has no maximum capacity
+    if max_capacity is None:
+        return None
+    return max(max_capacity - attendee_count, 0)
+
+
+def list_fields(query_params):
+    """
+    Return the fields of the events of a list response, in serializer order.
+
+    The ``fields`` query param (comma separated) selects them; without it, the
+    default fields are returned, with the attendee ids if ``include=attendees``.
+
+    Raises:
+        InvalidFilter: If a field does not exist.
+    """
+    names = {name.strip() for name in query_params.get('fields', '').split(',') if name.strip()}
+    if not names:
+        names = set(DEFAULT_LIST_FIELDS)
+        if 'attendees' in query_params.get('include', '').split(','):
+            names.add('attendees')
+    unknown = names.difference(EventListSerializer.Meta.fields)
+    if unknown:
+        raise InvalidFilter(f"Invalid fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in EventListSerializer.Meta.fields if name in names)
+
+
+def list_columns(fields):
+    return list(dict.fromkeys(column for name in fields for column in LIST_FIELD_COLUMNS[name]))
+
+
+def only_list_fields(events, fields):
+    """
+    Narrow an events queryset to the columns and relations needed to serialize
+    fields with EventListSerializer.
+    """
+    events = events.with_related(attendees='attendees' in fields)
+    if 'owner' not in fields:
+        events = events.select_related(None)
+    return events.only(*list_columns(fields))
+
+
+class EventValuesSerializer:
+    """
+    Fast path of EventListSerializer, building list responses from values() rows.
+
+    A ModelSerializer builds a model instance per event and runs a field object
+    per value; this only reads the columns of the requested fields, and formats
+    the rows directly, with the same output.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def get_queryset(self, events, *columns):
+        """
+        Return the values() queryset of events to serialize, with the extra columns
+        (e.g. the pagination key).
+        """
+        return events.values(*dict.fromkeys(list_columns(self.fields) + ['id', *columns]))
+
+    def get_attendees_queryset(self, rows):
+        return (
+            Event.attendees.through.objects
+            .filter(event__in=[row['id'] for row in rows])
+            .values_list('event_id', 'customuser_id')
+        )
+
+    def to_representation(self, rows, attendees=None):
+        """
+        Serialize values() rows; attendees are the (event id, user id) pairs of
+        the events, queried here if the attendees field is selected.
+        """
+        if 'attendees' in self.fields:
+            if attendees is None:
+                attendees = self.get_attendees_queryset(rows)
+            attendee_ids = {row['id']: [] for row in rows}
+            for event_id, user_id in attendees:
+                attendee_ids[event_id].append(user_id)
+        # Resolve the current timezone once, instead of once per datetime
+        current_timezone = get_current_timezone() if settings.USE_TZ else None
+        to_datetime = serializers.DateTimeField(default_timezone=current_timezone).to_representation
+        data = []
+        for row in rows:
+            item = {}
+            for name in self.fields:
+                if name == 'owner':
+                    item[name] = row['owner__username']
+                elif name == 'attendees':
+                    item[name] = attendee_ids[row['id']]
+                elif name == 'spots_left':
+                    item[name] = spots_left(row['max_capacity'], row['attendee_count'])
+                elif name in ('start_date', 'end_date'):
+                    item[name] = to_datetime(row[name])
+                else:
+                    item[name] = row[name]
+            data.append(item)
+        return data
+
+    async def ato_representation(self, rows):
+        """
+        Async version of to_representation, for views running on the event loop.
+        """
+        attendees = None
+        if 'attendees' in self.fields:
+            attendees = [pair async for pair in self.get_attendees_queryset(rows)]
+        return self.to_representation(rows, attendees)
+
+
+class AttendeeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomUser
+        fields = ('id', 'username')
 
 
 class EditEventSerializer(serializers.ModelSerializer):
@@ -62,21 +240,3 @@ class EditEventSerializer(serializers.ModelSerializer):
         if all([data.get(field) is None for field in data]):
             raise serializers.ValidationError("At least one field is required")
         return data
-
-class RegisterEventSerializer(serializers.ModelSerializer):
-    attendees = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
-    
-    class Meta:
-        model = Event
-        fields = ('id', 'attendees')
-        extra_kwargs = {
-            'id': {'required': False},
-            'attendees': {'required': False},
-        }
-        read_only_fields = ['id',]
-
-    def update(self, instance, validated_data):
-        # Update the attendees field with the current user
-        user = self.context['request'].user
-        instance.attendees.add(user)
-        return instance
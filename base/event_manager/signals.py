@@ -0,0 +1,43 @@
+from django.db.models import F
+from django.utils import timezone
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_event_list_on_commit
+from .models import CustomUser, Event
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_cached_event_list(sender, **kwargs):
+    invalidate_event_list_on_commit()
+
+
+@receiver(m2m_changed, sender=Event.attendees.through)
+def sync_attendee_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep Event.attendee_count in sync when attendees are changed through the
+    related managers (e.g. the admin) instead of Event.add_attendee.
+    """
+    if not reverse:
+        event_ids = [instance.pk]
+    elif action == 'pre_clear':
+        instance._cleared_event_ids = list(instance.events_attending.values_list('pk', flat=True))
+        return
+    elif action == 'post_clear':
+        event_ids = getattr(instance, '_cleared_event_ids', [])
+    else:
+        event_ids = pk_set or []
+
+    if action in ('post_add', 'post_remove', 'post_clear') and event_ids:
+        Event.objects.filter(pk__in=event_ids).refresh_attendee_counts()
+        invalidate_event_list_on_commit()
+
+
+@receiver(pre_delete, sender=CustomUser)
+def release_attended_seats(sender, instance, **kwargs):
+    """
+    Give back the seats of a deleted user (the attendees rows are removed by cascade).
+    """
+    Event.objects.filter(attendees=instance).update(attendee_count=F('attendee_count') - 1, updated_at=timezone.now())
+    invalidate_event_list_on_commit()
@@ -0,0 +1,19 @@
+"""
+SQLite tuning applied to every new connection.
+"""
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    connection_created handler running the PRAGMAs of EVENT_MANAGER_SQLITE_PRAGMAS
+    on new SQLite connections (Django 5.0 has no init_command for SQLite).
+
+    journal_mode=WAL is persistent in the database file; the other PRAGMAs only
+    last for the connection, hence CONN_MAX_AGE to reuse configured connections.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.EVENT_MANAGER_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -1,3 +1,1617 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import csv
+from decimal import Decimal
+import gzip
+import importlib.util
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections, DatabaseError, OperationalError
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from django.core.management import call_command
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .blacklist import BloomBlacklistChecker, BloomFilter, get_checker, reset_checker, warm_checker
+from .cache import check_shared_cache, get_cache, invalidate_event_list, stats as cache_stats
+from .compression import choose_encoding, parse_accept_encoding
+from .filters import filter_events
+from .log_handlers import QueuedRotatingFileHandler
+from .metrics import Histogram, registry as metrics_registry
+from . import tokens
+from .tokens import PRUNE_LEASE_KEY, prune_expired_tokens, start_token_pruning, TokenPruneScheduler
+from .models import AlreadyRegistered, CustomUser, Event, EventFull
+from .pagination import EventCursorPagination
+from .renderers import FastJSONRenderer
+from .routers import PIN_COOKIE, RoutingState
+from .serializers import EventListSerializer, EventSerializer, EventValuesSerializer
+from .search import FTS_TABLE, install_search_index, search_events, search_filter
+
+
+class EventTestMixin:
+    """
+    Helpers shared by the event_manager test cases.
+    """
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+        reset_checker()
+
+    @contextmanager
+    def assertNumStatements(self, num):
+        """
+        Like assertNumQueries, ignoring the savepoints of transaction.atomic().
+        """
+        with CaptureQueriesContext(connection) as queries:
+            yield
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), num, '\n'.join(statements))
+
+    def create_user(self, username='alice', password=None):
+        return CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password=password)
+
+    def create_events(self, owner, count, start=None, **kwargs):
+        start = start or datetime(2030, 1, 1, tzinfo=timezone.utc)
+        return Event.objects.bulk_create([
+            Event(
+                name=f'Event {i}',
+                start_date=start + timedelta(hours=i),
+                end_date=start + timedelta(hours=i + 1),
+                owner=owner,
+                **kwargs
+            )
+            for i in range(count)
+        ])
+
+    def authenticated_client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+
+@override_settings(EVENT_MANAGER_PAGE_SIZE=10, EVENT_MANAGER_MAX_PAGE_SIZE=25)
+class CursorPaginationTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+
+    def collect_pages(self, url, **params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(event['id'] for event in response.data['results'])
+            pages += 1
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_all_events_in_order(self):
+        # Same start date for several events: the id breaks the tie
+        same_start = datetime(2031, 1, 1, tzinfo=timezone.utc)
+        self.create_events(self.user, 15)
+        for _ in range(8):
+            Event.objects.create(name='Tie', start_date=same_start, end_date=same_start + timedelta(hours=1), owner=self.user)
+
+        ids, pages = self.collect_pages(reverse('all-events'))
+
+        expected = list(Event.objects.order_by('start_date', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_page_size_is_capped(self):
+        self.create_events(self.user, 30)
+        response = self.client.get(reverse('all-events'), {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 25)
+
+    def test_user_events_are_paginated(self):
+        other = self.create_user('bob')
+        self.create_events(self.user, 12)
+        self.create_events(other, 5)
+
+        ids, pages = self.collect_pages(reverse('user-events'))
+
+        self.assertEqual(len(ids), 12)
+        self.assertEqual(pages, 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('all-events'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(EVENT_MANAGER_MAX_PAGE_SIZE=1000)
+class EventQueryBudgetTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        attendees = [self.create_user(f'attendee{i}') for i in range(3)]
+        Event.attendees.through.objects.bulk_create([
+            Event.attendees.through(event=event, customuser=attendee)
+            for event in self.create_events(self.user, 1000)
+            for attendee in attendees
+        ])
+        Event.objects.refresh_attendee_counts()
+        access, _ = self.user.generate_tokens()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_list_events_query_budget(self):
+        # Authentication, validators aggregate and events page (with owner)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('all-events'), {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 1000)
+        event = response.data['results'][0]
+        self.assertNotIn('attendees', event)
+        self.assertEqual(event['attendee_count'], 3)
+        self.assertIsNone(event['spots_left'])
+        self.assertEqual(event['owner'], 'alice')
+
+    def test_list_events_include_attendees_query_budget(self):
+        # One more query: the attendee prefetch
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('all-events'), {'page_size': 1000, 'include': 'attendees'})
+        self.assertEqual(len(response.data['results'][0]['attendees']), 3)
+
+    def test_user_events_query_budget(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('user-events'), {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 1000)
+
+
+class RegistrationTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user()
+        self.event = self.create_events(self.owner, 1, max_capacity=2)[0]
+
+    def register(self, user):
+        return self.authenticated_client(user).post(reverse('event-register', args=[self.event.pk]))
+
+    def test_register_and_unregister_update_attendee_count(self):
+        user = self.create_user('bob')
+        self.assertTrue(self.register(user).json()['success'])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 1)
+
+        response = self.authenticated_client(user).post(reverse('event-unregister', args=[self.event.pk]))
+        self.assertEqual(response.json()['messagge'], 'user unregistred for the event')
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 0)
+
+    def test_register_twice(self):
+        user = self.create_user('bob')
+        self.register(user)
+        response = self.register(user)
+        self.assertEqual(response.status_code, 400)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 1)
+
+    def test_register_full_event(self):
+        self.register(self.create_user('bob'))
+        self.register(self.create_user('carol'))
+        response = self.register(self.create_user('dave'))
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(response.data['success'])
+        self.assertTrue(response.data['waitlisted'])
+        self.assertEqual(self.event.attendees.count(), 2)
+
+    def test_register_query_count(self):
+        user = self.create_user('bob')
+        client = self.authenticated_client(user)
+        # Event lookup, membership insert and conditional counter update
+        with self.assertNumStatements(3):
+            client.post(reverse('event-register', args=[self.event.pk]))
+
+    def test_related_manager_changes_keep_count_in_sync(self):
+        users = [self.create_user('bob'), self.create_user('carol')]
+        self.event.attendees.add(*users)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 2)
+        users[0].delete()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 1)
+
+
+class WaitlistTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user()
+        self.event = self.create_events(self.owner, 1, max_capacity=1)[0]
+        self.attendee = self.create_user('bob')
+        self.event.add_attendee(self.attendee)
+
+    def post(self, user, view):
+        return self.authenticated_client(user).post(reverse(view, args=[self.event.pk]))
+
+    def get_status(self, user):
+        return self.authenticated_client(user).get(reverse('event-status', args=[self.event.pk])).json()
+
+    def test_full_event_waitlists_in_order(self):
+        users = [self.create_user(name) for name in ('carol', 'dave', 'erin')]
+        for place, user in enumerate(users, 1):
+            response = self.post(user, 'event-register')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['position'], place)
+            self.assertEqual(response.data['status_url'], reverse('event-status', args=[self.event.pk]))
+        self.assertEqual(self.get_status(users[2]), {
+            'event': self.event.pk, 'status': 'waitlisted', 'position': 3,
+            'attendee_count': 1, 'max_capacity': 1, 'spots_left': 0,
+        })
+
+    def test_register_again_keeps_place(self):
+        user = self.create_user('carol')
+        self.post(user, 'event-register')
+        self.post(self.create_user('dave'), 'event-register')
+        response = self.post(user, 'event-register')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['position'], 1)
+        self.assertEqual(self.event.waitlist.count(), 2)
+
+    def test_unregister_promotes_head_of_waitlist(self):
+        carol, dave = self.create_user('carol'), self.create_user('dave')
+        self.post(carol, 'event-register')
+        self.post(dave, 'event-register')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post(self.attendee, 'event-unregister')
+
+        self.assertEqual(list(self.event.attendees.all()), [carol])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 1)
+        self.assertEqual(self.get_status(carol)['status'], 'registered')
+        self.assertEqual(self.get_status(dave)['position'], 1)
+        self.assertEqual(self.get_status(self.attendee)['status'], 'none')
+
+    def test_unregister_leaves_waitlist(self):
+        carol, dave = self.create_user('carol'), self.create_user('dave')
+        self.post(carol, 'event-register')
+        self.post(dave, 'event-register')
+        response = self.post(carol, 'event-unregister')
+        self.assertEqual(response.json()['messagge'], 'user removed from the waitlist')
+        self.assertEqual(self.get_status(dave)['position'], 1)
+
+    def test_raised_capacity_promotes_waitlist(self):
+        users = [self.create_user(name) for name in ('carol', 'dave', 'erin')]
+        for user in users:
+            self.post(user, 'event-register')
+        response = self.authenticated_client(self.owner).put(
+            reverse('event-edit', args=[self.event.pk]), {'max_capacity': 3}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.event.attendees.all()), {self.attendee, *users[:2]})
+        self.assertEqual(self.get_status(users[2])['position'], 1)
+
+    def test_failed_promotion_keeps_the_capacity(self):
+        self.post(self.create_user('carol'), 'event-register')
+        with mock.patch.object(Event, 'promote_waitlist', side_effect=DatabaseError('promotion failed')):
+            with self.assertRaises(DatabaseError):
+                self.authenticated_client(self.owner).put(
+                    reverse('event-edit', args=[self.event.pk]), {'max_capacity': 2}, format='json',
+                )
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.max_capacity, 1)
+
+    def test_capacity_edit_starts_with_a_write_outside_search_fields(self):
+        client = self.authenticated_client(self.owner)
+        url = reverse('event-edit', args=[self.event.pk])
+        # The full-text search trigger fires on updates of these columns
+        search_fields = ('"name"', '"description"', '"location"')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.put(url, {'name': 'Renamed', 'max_capacity': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        statements = [query['sql'] for query in queries if query['sql'].startswith(('SAVEPOINT', 'UPDATE'))]
+        self.assertTrue(statements[0].startswith('SAVEPOINT'), statements)
+        self.assertTrue(statements[1].startswith('UPDATE'), statements)
+        self.assertFalse(any(field in statements[1] for field in search_fields), statements[1])
+
+        # No transaction without a capacity change
+        with CaptureQueriesContext(connection) as queries:
+            response = client.put(url, {'name': 'Renamed again'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'SAVEPOINT' in query['sql']])
+
+    def test_promotion_starts_with_a_write(self):
+        self.post(self.create_user('carol'), 'event-register')
+        for capacity in (1, 2):
+            Event.objects.filter(pk=self.event.pk).update(max_capacity=capacity)
+            with CaptureQueriesContext(connection) as queries:
+                self.event.promote_waitlist()
+            statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+            self.assertTrue(statements[0].startswith('UPDATE'), statements[0])
+        self.assertEqual(self.event.attendees.count(), 2)
+
+    def test_promotion_skips_registered_users(self):
+        carol, dave = self.create_user('carol'), self.create_user('dave')
+        self.event.add_attendee(carol, waitlist=True)
+        self.event.add_attendee(dave, waitlist=True)
+        # Registered meanwhile, e.g. while the capacity was raised
+        Event.objects.filter(pk=self.event.pk).update(max_capacity=2)
+        self.event.add_attendee(carol)
+        Event.objects.filter(pk=self.event.pk).update(max_capacity=3)
+
+        self.assertEqual(self.event.promote_waitlist(), [dave.pk])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 3)
+        self.assertFalse(self.event.waitlist.exists())
+
+    def test_add_attendee_without_waitlist_raises(self):
+        with self.assertRaises(EventFull):
+            self.event.add_attendee(self.create_user('carol'))
+        self.assertFalse(self.event.waitlist.exists())
+
+    def test_async_register_waitlists(self):
+        user = self.create_user('carol')
+        token = str(RefreshToken.for_user(user).access_token)
+        response = self.client.post(
+            reverse('async-event-register', args=[self.event.pk]), HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['position'], 1)
+
+
+class AttendeeListTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user()
+        self.client = self.authenticated_client(self.owner)
+        self.event = self.create_events(self.owner, 1, max_capacity=10)[0]
+        self.attendees = [self.create_user(f'attendee{i}') for i in range(5)]
+        for attendee in self.attendees:
+            self.event.add_attendee(attendee)
+
+    def test_list_events_counts(self):
+        event = self.client.get(reverse('all-events')).data['results'][0]
+        self.assertEqual(event['attendee_count'], 5)
+        self.assertEqual(event['spots_left'], 5)
+        self.assertNotIn('attendees', event)
+
+    def test_include_attendees(self):
+        response = self.client.get(reverse('all-events'), {'include': 'attendees'})
+        self.assertCountEqual(response.data['results'][0]['attendees'], [user.pk for user in self.attendees])
+
+    def test_attendees_pagination(self):
+        url = reverse('event-attendees', args=[self.event.pk])
+        # Event lookup and attendees page
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'page_size': 2})
+        usernames = [attendee['username'] for attendee in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            usernames += [attendee['username'] for attendee in response.data['results']]
+        self.assertEqual(usernames, [user.username for user in self.attendees])
+
+    def test_attendees_of_missing_event(self):
+        response = self.client.get(reverse('event-attendees', args=[self.event.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SparseFieldsetTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        self.create_events(self.user, 3)
+        Event.objects.create(
+            name='Jazz night', description='Live jazz', location='Rome', max_capacity=2, owner=self.user,
+            start_date=datetime(2030, 2, 1, 20, tzinfo=timezone.utc), end_date=datetime(2030, 2, 1, 23, tzinfo=timezone.utc),
+        ).add_attendee(self.user)
+
+    def test_values_serializer_matches_list_serializer(self):
+        fields = EventListSerializer.Meta.fields
+        expected = EventListSerializer(Event.objects.with_related(), many=True, context={'fields': fields}).data
+        serializer = EventValuesSerializer(fields)
+        self.assertEqual(serializer.to_representation(list(serializer.get_queryset(Event.objects.all()))), expected)
+
+    def test_fields_narrow_query_and_output(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('all-events'), {'fields': 'id,name'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name'])
+        page_query = queries[-1]['sql']
+        self.assertNotIn('description', page_query)
+        self.assertNotIn('customuser', page_query)
+
+    def test_fields_with_search(self):
+        response = self.client.get(reverse('all-events'), {'q': 'jazz', 'fields': 'name,spots_left'})
+        self.assertEqual(response.data['results'], [{'name': 'Jazz night', 'spots_left': 1}])
+
+    def test_fields_of_user_events(self):
+        response = self.client.get(reverse('user-events'), {'fields': 'owner,attendees', 'page_size': 1})
+        self.assertEqual(response.data['results'], [{'attendees': [], 'owner': 'alice'}])
+
+    def test_invalid_fields(self):
+        response = self.client.get(reverse('all-events'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Invalid fields: password')
+
+
+class ScheduleTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        owner = self.create_user('owner')
+        day = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        spans = {
+            'morning': (9, 12),
+            'lunch': (12, 14),
+            'workshop': (11, 16),
+            'keynote': (15, 16),
+            'evening': (18, 20),
+        }
+        self.events = {
+            name: Event.objects.create(
+                name=name, start_date=day + timedelta(hours=start), end_date=day + timedelta(hours=end), owner=owner,
+            )
+            for name, (start, end) in spans.items()
+        }
+
+    def register(self, name, conflicts=None):
+        url = reverse('event-register', args=[self.events[name].pk])
+        if conflicts:
+            url += f'?conflicts={conflicts}'
+        return self.client.post(url)
+
+    def test_reject_conflicts(self):
+        self.register('morning')
+        self.register('keynote')
+        response = self.register('workshop', 'reject')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'], [self.events['morning'].pk, self.events['keynote'].pk])
+        self.assertFalse(self.events['workshop'].attendees.exists())
+        self.events['workshop'].refresh_from_db()
+        self.assertEqual(self.events['workshop'].attendee_count, 0)
+        # Back to back events do not overlap
+        self.assertEqual(self.register('lunch', 'reject').status_code, 200)
+
+    def test_warn_conflicts(self):
+        self.register('morning')
+        response = self.register('workshop', 'warn')
+        self.assertEqual(response.json()['conflicts'], [self.events['morning'].pk])
+        self.assertEqual(self.register('evening', 'warn').json()['conflicts'], [])
+        self.assertNotIn('conflicts', self.register('lunch').json())
+        self.assertEqual(self.register('keynote', 'sometimes').status_code, 400)
+
+    def test_conflict_check_is_one_query(self):
+        self.register('morning')
+        with self.assertNumQueries(1):
+            self.events['workshop'].get_conflicts(self.user)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_conflict_check_reads_the_attendance_of_the_user(self):
+        event = self.events['workshop']
+        plan = Event.objects.attended_overlapping(self.user, event.start_date, event.end_date).explain()
+        self.assertIn('customuser_id=?', plan)
+        self.assertNotIn('SCAN event_manager_event', plan)
+
+    def test_schedule(self):
+        for name in ('evening', 'keynote', 'workshop', 'morning', 'lunch'):
+            self.register(name)
+        self.create_events(self.user, 3)
+        response = self.client.get(reverse('user-schedule'))
+        schedule = json.loads(b''.join(response.streaming_content))
+        ids = {name: event.pk for name, event in self.events.items()}
+        self.assertEqual([(entry['name'], entry['overlaps']) for entry in schedule], [
+            ('morning', []),
+            ('workshop', [ids['morning']]),
+            ('lunch', [ids['workshop']]),
+            ('keynote', [ids['workshop']]),
+            ('evening', []),
+        ])
+        self.assertEqual(schedule[0]['start_date'], '2030-01-01T10:00:00+01:00')
+
+    def test_schedule_filters(self):
+        self.register('morning')
+        self.register('evening')
+        response = self.client.get(reverse('user-schedule'), {'from': '2030-01-01T17:00:00Z'})
+        self.assertEqual([entry['name'] for entry in json.loads(b''.join(response.streaming_content))], ['evening'])
+        response = self.client.get(reverse('user-schedule'), {'status': 'someday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentRegistrationTests(EventTestMixin, TransactionTestCase):
+    """
+    Registrations from many threads (one database connection each) must never
+    overbook an event.
+    """
+    capacity = 5
+    registrations = 40
+    # Retries of a registration on a locked database (about 10 seconds), before giving up
+    max_retries = 200
+
+    def register(self, event_id, user):
+        try:
+            for attempt in range(self.max_retries):
+                try:
+                    Event.objects.get(pk=event_id).add_attendee(user)
+                    return 'registered'
+                except EventFull:
+                    return 'full'
+                except AlreadyRegistered:
+                    return 'duplicate'
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    # Locked database (concurrent writer): retry
+                    time.sleep(min(0.001 * 2 ** attempt, 0.05))
+            return 'locked'
+        finally:
+            connection.close()
+
+    def test_capacity_is_never_exceeded(self):
+        owner = self.create_user()
+        event = self.create_events(owner, 1, max_capacity=self.capacity)[0]
+        users = [self.create_user(f'user{i}') for i in range(self.registrations)]
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(lambda user: self.register(event.pk, user), users))
+
+        self.assertEqual(results.count('locked'), 0, 'registrations still locked out after the retries')
+        event.refresh_from_db()
+        self.assertEqual(results.count('registered'), self.capacity)
+        self.assertEqual(results.count('full'), self.registrations - self.capacity)
+        self.assertEqual(event.attendee_count, self.capacity)
+        self.assertEqual(event.attendees.count(), self.capacity)
+
+
+class ConcurrentEditTests(EventTestMixin, TransactionTestCase):
+    """
+    Edits of an event from many threads, with and without a capacity change,
+    must all succeed and promote the waitlist.
+    """
+    edits = 20
+    # Retries of an edit on a locked database, as in ConcurrentRegistrationTests
+    max_retries = 200
+
+    def edit(self, event_id, data):
+        client = self.authenticated_client(self.owner)
+        try:
+            for attempt in range(self.max_retries):
+                try:
+                    return client.put(reverse('event-edit', args=[event_id]), data, format='json').status_code
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    time.sleep(min(0.001 * 2 ** attempt, 0.05))
+            return 'locked'
+        finally:
+            connection.close()
+
+    def test_concurrent_edits(self):
+        self.owner = self.create_user()
+        event = self.create_events(self.owner, 1, max_capacity=1)[0]
+        users = [self.create_user(f'user{i}') for i in range(5)]
+        for user in users:
+            event.add_attendee(user, waitlist=True)
+        edits = [
+            {'max_capacity': 1 + i % 5} if i % 2 else {'name': f'Event {i}', 'description': f'Edit {i}'}
+            for i in range(self.edits)
+        ]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda data: self.edit(event.pk, data), edits))
+
+        self.assertEqual(results, [200] * self.edits)
+        event.refresh_from_db()
+        # One of the edits raised the capacity to 5 (lowering it unregisters no one)
+        self.assertEqual(event.attendee_count, len(users))
+        self.assertEqual(event.attendees.count(), len(users))
+        self.assertFalse(event.waitlist.exists())
+
+
+class EventFilterTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+
+    def test_date_filters_use_local_day_boundaries(self):
+        # 23:30 UTC on Jan 1st is already Jan 2nd in Europe/Rome
+        start = datetime(2030, 1, 1, 23, 30, tzinfo=timezone.utc)
+        event = Event.objects.create(name='Late', start_date=start, end_date=start + timedelta(days=2), owner=self.user)
+
+        response = self.client.get(reverse('all-events'), {'start_date': '2030-01-02'})
+        self.assertEqual([e['id'] for e in response.data['results']], [event.pk])
+        response = self.client.get(reverse('all-events'), {'start_date': '2030-01-01'})
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get(reverse('all-events'), {'end_date': '2030-01-04'})
+        self.assertEqual([e['id'] for e in response.data['results']], [event.pk])
+
+    def test_status_filters(self):
+        now = datetime.now(timezone.utc)
+        past = Event.objects.create(name='Past', start_date=now - timedelta(days=3), end_date=now - timedelta(days=2), owner=self.user)
+        ongoing = Event.objects.create(name='Ongoing', start_date=now - timedelta(days=3), end_date=now + timedelta(days=2), owner=self.user)
+        upcoming = Event.objects.create(name='Upcoming', start_date=now + timedelta(days=2), end_date=now + timedelta(days=3), owner=self.user)
+
+        for status, event in (('past', past), ('ongoing', ongoing), ('upcoming', upcoming)):
+            response = self.client.get(reverse('all-events'), {'status': status})
+            self.assertEqual([e['id'] for e in response.data['results']], [event.pk])
+
+    def test_invalid_filters(self):
+        response = self.client.get(reverse('all-events'), {'status': 'someday'})
+        self.assertEqual(response.data, {'error': 'Invalid status filter'})
+        response = self.client.get(reverse('all-events'), {'start_date': '01/01/2030'})
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_filters_do_not_scan_the_event_table(self):
+        ordering = EventCursorPagination.ordering
+        for params in ('status=upcoming', 'status=ongoing', 'status=past', 'start_date=2030-01-01', 'end_date=2030-01-01',
+                       'from=2030-01-01&to=2030-01-08'):
+            with self.subTest(params=params):
+                events = filter_events(Event.objects.all(), QueryDict(params)).order_by(*ordering)[:100]
+                plan = events.explain()
+                self.assertNotIn('SCAN event_manager_event', plan)
+                self.assertIn('USING INDEX', plan)
+
+        plan = Event.objects.filter(owner=self.user).order_by(*ordering)[:100].explain()
+        self.assertIn('USING INDEX event_owner_start_idx', plan)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_overlap_filter_bounds_the_start_date_range(self):
+        events = filter_events(Event.objects.all(), QueryDict('from=2030-01-01&to=2030-01-08'))
+        plan = events.order_by(*EventCursorPagination.ordering)[:100].explain()
+        self.assertIn('event_start_idx (start_date>? AND start_date<?)', plan)
+        self.assertIn('event_duration_idx (duration>?)', plan)
+
+    @override_settings(EVENT_MANAGER_OVERLAP_MAX_DURATION=timedelta(days=2))
+    def test_overlap_filter(self):
+        day = datetime(2030, 3, 10, tzinfo=timezone.utc)
+        spans = {
+            'before': (day - timedelta(days=1), day - timedelta(hours=1)),
+            'ends_at_start': (day - timedelta(hours=3), day),
+            'crosses_start': (day - timedelta(hours=3), day + timedelta(hours=1)),
+            'inside': (day + timedelta(hours=2), day + timedelta(hours=4)),
+            'starts_at_end': (day + timedelta(days=1), day + timedelta(days=1, hours=2)),
+            'two_days': (day - timedelta(days=2) + timedelta(minutes=1), day + timedelta(minutes=1)),
+            'long_covering': (day - timedelta(days=400), day + timedelta(days=400)),
+            'long_before': (day - timedelta(days=400), day - timedelta(days=1)),
+            'long_inside_later': (day + timedelta(hours=20), day + timedelta(days=30)),
+        }
+        for name, (start, end) in spans.items():
+            Event.objects.create(name=name, start_date=start, end_date=end, owner=self.user)
+
+        response = self.client.get(reverse('all-events'), {'from': '2030-03-10T00:00:00Z', 'to': '2030-03-11T01:00:00+01:00'})
+        self.assertEqual(
+            [e['name'] for e in response.data['results']],
+            ['long_covering', 'two_days', 'crosses_start', 'inside', 'long_inside_later'],
+        )
+        # Open ended windows
+        response = self.client.get(reverse('all-events'), {'from': '2030-03-11T00:00:00Z'})
+        self.assertEqual([e['name'] for e in response.data['results']], ['long_covering', 'long_inside_later', 'starts_at_end'])
+        response = self.client.get(reverse('all-events'), {'to': '2030-03-09T00:00:00Z'})
+        self.assertEqual([e['name'] for e in response.data['results']], ['long_covering', 'long_before', 'two_days'])
+        # Dates are days of the current timezone: Europe/Rome is one hour ahead of UTC
+        response = self.client.get(reverse('all-events'), {'from': '2030-03-10', 'to': '2030-03-10T00:30:00Z'})
+        self.assertEqual([e['name'] for e in response.data['results']], ['long_covering', 'two_days', 'ends_at_start', 'crosses_start'])
+
+    def test_invalid_overlap_filters(self):
+        response = self.client.get(reverse('all-events'), {'from': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('all-events'), {'from': '2030-01-02', 'to': '2030-01-01'})
+        self.assertEqual(response.data, {'error': 'Invalid from/to filter (from must be before to)'})
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'FTS5 search is SQLite specific')
+class SearchTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        start = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        self.concert, self.talk, self.workshop = Event.objects.bulk_create([
+            Event(name='Jazz concert', description='Live music', location='Rome', start_date=start, end_date=start, owner=self.user),
+            Event(name='Python talk', description='Followed by a jazz jam session', location='Milan', start_date=start, end_date=start, owner=self.user),
+            Event(name='Pottery workshop', description=None, location='Jazz club', start_date=start, end_date=start, owner=self.user),
+        ])
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('all-events'), dict(params, q=q))
+        self.assertEqual(response.status_code, 200, response.data)
+        return [event['id'] for event in response.data['results']]
+
+    def test_ranked_by_field_weight(self):
+        # Name, then location, then description matches
+        self.assertEqual(self.search('jazz'), [self.concert.pk, self.workshop.pk, self.talk.pk])
+
+    def test_all_words_match_last_as_prefix(self):
+        self.assertEqual(self.search('jazz mus'), [self.concert.pk])
+        self.assertEqual(self.search('PYTHON Milan'), [self.talk.pk])
+        self.assertEqual(self.search('jazz opera'), [])
+
+    def test_index_follows_writes(self):
+        self.concert.name = 'Opera night'
+        self.concert.save()
+        self.workshop.delete()
+        self.assertEqual(self.search('opera'), [self.concert.pk])
+        self.assertEqual(self.search('jazz'), [self.talk.pk])
+        # Queryset updates (no signals) are indexed by the triggers too
+        Event.objects.filter(pk=self.talk.pk).update(description='Blues')
+        self.assertEqual(search_events(Event.objects.all(), 'jazz'), [])
+
+    def test_combined_with_filters(self):
+        start = datetime(2031, 1, 1, 10, tzinfo=timezone.utc)
+        late = Event.objects.create(name='Jazz brunch', start_date=start, end_date=start, owner=self.user)
+        self.assertEqual(self.search('jazz', start_date='2031-01-01'), [late.pk])
+
+    def test_pagination(self):
+        self.create_events(self.user, 25, location='Jazz bar')
+        expected = self.search('jazz', page_size=100)
+        found, params = [], {'page_size': 7}
+        while True:
+            response = self.client.get(reverse('all-events'), dict(params, q='jazz'))
+            found += [event['id'] for event in response.data['results']]
+            if not response.data['next']:
+                break
+            params['cursor'] = QueryDict(response.data['next'].split('?', 1)[1])['cursor']
+        self.assertEqual(len(expected), 28)
+        self.assertEqual(found, expected)
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('name:jazz OR "'), [])
+        self.assertEqual(self.search('jazz AND'), [])
+        response = self.client.get(reverse('all-events'), {'q': '*!?'})
+        self.assertEqual(response.data, {'error': 'Invalid search query'})
+
+    def test_fallback_filter(self):
+        events = Event.objects.filter(search_filter('jazz ROME')).order_by('id')
+        self.assertEqual(list(events), [self.concert])
+
+    def test_triggers_are_reinstalled(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {FTS_TABLE}_insert')
+        Event.objects.create(name='Jazz picnic', start_date=self.concert.start_date, end_date=self.concert.end_date, owner=self.user)
+        install_search_index(connection)
+        self.assertEqual(len(self.search('picnic')), 1)
+
+
+class EventListCacheTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        self.event = self.create_events(self.user, 3)[0]
+
+    def test_repeated_request_is_served_from_cache(self):
+        hits = cache_stats.hits
+        self.assertEqual(self.client.get(reverse('all-events'))['X-Cache'], 'MISS')
+        # The ETag is cached too
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('all-events'))
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(cache_stats.hits, hits + 1)
+
+    def test_query_params_are_normalized(self):
+        self.client.get(reverse('all-events') + '?status=upcoming&page_size=2')
+        response = self.client.get(reverse('all-events') + '?page_size=2&status=upcoming')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        response = self.client.get(reverse('all-events') + '?page_size=3&status=upcoming')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_writes_invalidate_the_cache(self):
+        self.client.get(reverse('all-events'))
+        data = {'name': 'New', 'start_date': '2031-01-01T10:00:00Z', 'end_date': '2031-01-01T12:00:00Z'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('event-create'), data, format='json')
+        response = self.client.get(reverse('all-events'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('event-register', args=[self.event.pk]))
+        response = self.client.get(reverse('all-events'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['attendee_count'], 1)
+
+    def test_invalidation_from_another_process(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            with override_settings(CACHES={**settings.CACHES, settings.EVENT_MANAGER_CACHE: shared}):
+                self.client.get(reverse('all-events'))
+                self.assertEqual(self.client.get(reverse('all-events'))['X-Cache'], 'HIT')
+                # The cache of another worker process, on the same storage
+                other = caches.create_connection(settings.EVENT_MANAGER_CACHE)
+                with mock.patch('event_manager.cache.get_cache', return_value=other):
+                    invalidate_event_list()
+                self.assertEqual(self.client.get(reverse('all-events'))['X-Cache'], 'MISS')
+
+    @override_settings(EVENT_MANAGER_WORKERS=4)
+    def test_per_process_cache_with_several_workers_is_reported(self):
+        with self.assertLogs('event_manager', 'WARNING'):
+            self.assertFalse(check_shared_cache())
+        with self.settings(EVENT_MANAGER_WORKERS=1):
+            self.assertTrue(check_shared_cache())
+
+    def test_stats_endpoint_requires_admin(self):
+        self.assertEqual(self.client.get(reverse('events-cache-stats')).status_code, 403)
+        admin = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password=None)
+        response = self.authenticated_client(admin).get(reverse('events-cache-stats'))
+        self.assertEqual(set(response.data), {'hits', 'misses', 'hit_ratio'})
+
+
+class ConditionalRequestTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        self.event = self.create_events(self.user, 3)[0]
+
+    def test_if_none_match(self):
+        for url in (reverse('all-events'), reverse('user-events')):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                # The ETag is cached until the next write
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_no_last_modified(self):
+        response = self.client.get(reverse('all-events'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        # If-Modified-Since alone never gets a 304
+        response = self.client.get(reverse('all-events'), HTTP_IF_MODIFIED_SINCE='Wed, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_an_older_event_changes_the_etag(self):
+        etag = self.client.get(reverse('all-events'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.delete()
+        response = self.client.get(reverse('all-events'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_etag_depends_on_query_params(self):
+        etag = self.client.get(reverse('all-events'))['ETag']
+        response = self.client.get(reverse('all-events'), {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get(reverse('all-events'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('event-register', args=[self.event.pk]))
+        response = self.client.get(reverse('all-events'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Event.objects.filter(pk=self.event.pk).delete()
+        response = self.client.get(reverse('all-events'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(EVENT_MANAGER_EXPORT_CHUNK_SIZE=4)
+class ExportTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        self.events = self.create_events(self.user, 10, location='Rome')
+
+    def export(self, **params):
+        response = self.client.get(reverse('events-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [event.pk for event in self.events])
+        self.assertEqual(rows[0]['owner'], 'alice')
+        # Same representation as the list endpoint
+        listed = self.client.get(reverse('all-events')).data['results'][0]
+        self.assertEqual(rows[0]['start_date'], listed['start_date'])
+
+    def test_csv(self):
+        response, content = self.export(output='csv')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]['location'], 'Rome')
+
+    def test_filters(self):
+        _, content = self.export(start_date='2030-01-01', end_date='2030-01-01')
+        # Events start hourly from midnight UTC (01:00 in Rome)
+        self.assertEqual(len(content.splitlines()), 10)
+        _, content = self.export(status='past')
+        self.assertEqual(content, '')
+        response = self.client.get(reverse('events-export'), {'status': 'never'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_format(self):
+        response = self.client.get(reverse('events-export'), {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkCreateTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+
+    def event_data(self, count, start=datetime(2030, 1, 1, tzinfo=timezone.utc)):
+        return [
+            {
+                'name': f'Session {i}',
+                'start_date': (start + timedelta(hours=i)).isoformat(),
+                'end_date': (start + timedelta(hours=i, minutes=45)).isoformat(),
+                'max_capacity': 50,
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create(self):
+        with self.assertNumStatements(1):
+            response = self.client.post(reverse('event-bulk-create'), self.event_data(100), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 100)
+        self.assertEqual(Event.objects.filter(owner=self.user).count(), 100)
+
+    def test_partial_mode_reports_errors(self):
+        data = self.event_data(3)
+        data[1]['end_date'] = data[1]['start_date']
+        del data[2]['name']
+        response = self.client.post(reverse('event-bulk-create'), data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('End date must be after start date.', str(response.data['errors'][0]['errors']))
+        self.assertEqual(Event.objects.get().name, 'Session 0')
+
+    def test_partial_mode_validates_once(self):
+        data = self.event_data(4)
+        data[1]['end_date'] = data[1]['start_date']
+        with mock.patch.object(EventSerializer, 'validate', autospec=True, side_effect=EventSerializer.validate) as validate:
+            response = self.client.post(reverse('event-bulk-create'), data, format='json')
+        self.assertEqual(len(response.data['created']), 3)
+        self.assertEqual(validate.call_count, 4)
+
+    def test_atomic_mode(self):
+        data = self.event_data(3)
+        data[2]['end_date'] = data[2]['start_date']
+        response = self.client.post(reverse('event-bulk-create') + '?atomic=true', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], [])
+        self.assertFalse(Event.objects.exists())
+
+    @override_settings(EVENT_MANAGER_BULK_MAX_EVENTS=2)
+    def test_invalid_payloads(self):
+        for data in ({'name': 'Not a list'}, [], self.event_data(3)):
+            response = self.client.post(reverse('event-bulk-create'), data, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Event.objects.exists())
+
+
+class RendererTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        self.create_events(self.user, 3, description='Caffè\u2028e cornetto', max_capacity=10)
+
+    def test_fast_json_matches_stdlib(self):
+        data = {
+            'results': [{'when': datetime(2030, 1, 1, tzinfo=timezone.utc), 'price': Decimal('9.50')}],
+            'detail': gettext_lazy('Not found.'),
+            'text': 'Caffè\u2028',
+            1: None,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_events_payload(self):
+        response = self.client.get(reverse('all-events'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_indent_falls_back_to_stdlib(self):
+        data = {'name': 'Event'}
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'), b'{\n  "name": "Event"\n}')
+
+    @unittest.skipUnless(importlib.util.find_spec('msgpack'), 'msgpack is not installed')
+    def test_msgpack(self):
+        import msgpack
+        response = self.client.get(reverse('all-events'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        results = msgpack.unpackb(response.content)['results']
+        self.assertEqual(results, json.loads(JSONRenderer().render(response.data))['results'])
+
+
+@override_settings(EVENT_MANAGER_COMPRESSION_MIN_SIZE=1024)
+class CompressionTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        self.create_events(self.user, 20, description='A long description ' * 10)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(choose_encoding('*'), 'gzip')
+        self.assertIsNone(choose_encoding('gzip;q=0, deflate'))
+        self.assertIsNone(choose_encoding(''))
+        self.assertEqual(parse_accept_encoding('br;q=0.8, gzip;q=bad'), {'br': 0.8, 'gzip': 0.0})
+
+    def test_gzip(self):
+        plain = self.client.get(reverse('all-events'))
+        response = self.client.get(reverse('all-events'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+
+        # The weak ETag still validates
+        response = self.client.get(reverse('all-events'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get(reverse('all-events'), {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streamed_export(self):
+        response = self.client.get(reverse('events-export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 20)
+
+    @unittest.skipUnless(importlib.util.find_spec('brotli'), 'brotli is not installed')
+    def test_brotli(self):
+        import brotli
+        plain = self.client.get(reverse('all-events'))
+        response = self.client.get(reverse('all-events'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+
+class MetricsTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics_registry.reset()
+        self.user = self.create_user()
+        self.client = self.authenticated_client(self.user)
+        self.create_events(self.user, 5)
+
+    def test_server_timing_and_view_metrics(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('all-events'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn(f'desc="{len(queries)} queries"', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+        metrics = metrics_registry.as_dict()['all-events']
+        self.assertEqual(metrics['requests'], 1)
+        self.assertEqual(metrics['statuses'], {'2xx': 1})
+        self.assertEqual(metrics['db_queries']['max'], len(queries))
+        self.assertEqual(metrics['response_bytes']['max'], len(response.content))
+        self.assertGreater(metrics['serialize_ms']['max'], 0)
+        self.assertGreater(metrics['render_ms']['max'], 0)
+
+    def test_streamed_response(self):
+        response = self.client.get(reverse('events-export'))
+        self.assertNotIn('events-export', metrics_registry.as_dict())
+        # The export queries run while streaming
+        with CaptureQueriesContext(connection) as queries:
+            content = b''.join(response.streaming_content)
+        metrics = metrics_registry.as_dict()['events-export']
+        self.assertEqual(metrics['response_bytes']['max'], len(content))
+        self.assertGreaterEqual(metrics['db_queries']['max'], len(queries))
+
+    async def test_async_view(self):
+        access, _ = await sync_to_async(self.user.generate_tokens)()
+        response = await AsyncClient().get(reverse('async-all-events'), headers={'Authorization': f'Bearer {access}'})
+        self.assertIn('Server-Timing', response)
+        metrics = metrics_registry.as_dict()['async-all-events']
+        self.assertGreaterEqual(metrics['db_queries']['max'], 2)
+
+    @override_settings(EVENT_MANAGER_SLOW_QUERY_MS=0, EVENT_MANAGER_SLOW_QUERY_SAMPLE_RATE=1.0)
+    def test_slow_query_sampling(self):
+        with self.assertLogs('event_manager', 'WARNING') as logs:
+            self.client.get(reverse('user-events'))
+        self.assertIn('Slow query', logs.output[0])
+        self.assertIn('/events/user/', logs.output[0])
+
+    def test_metrics_endpoint_requires_admin(self):
+        self.client.get(reverse('all-events'))
+        self.assertEqual(self.client.get(reverse('performance-metrics')).status_code, 403)
+        admin = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password=None)
+        data = self.authenticated_client(admin).get(reverse('performance-metrics')).json()
+        self.assertEqual(data['views']['all-events']['requests'], 1)
+        self.assertIn('hit_ratio', data['event_list_cache'])
+        self.assertIn('false_positive_rate', data['token_blacklist'])
+
+    def test_histogram(self):
+        histogram = Histogram((1, 10, 100))
+        for value in (0.5, 2, 3, 50, 500):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentile(50), 10)
+        self.assertEqual(histogram.percentile(99), 500)
+        self.assertEqual(histogram.as_dict()['buckets'], {'1': 1, '10': 2, '100': 1, '+Inf': 1})
+
+
+class AsyncViewTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.events = self.create_events(self.user, 5, max_capacity=1)
+        access, _ = self.user.generate_tokens()
+        self.headers = {'Authorization': f'Bearer {access}'}
+        self.async_client = AsyncClient()
+
+    async def test_list_events_matches_sync_view(self):
+        response = await self.async_client.get(reverse('async-all-events'), {'page_size': 3}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), 3)
+
+        client = await sync_to_async(self.authenticated_client)(self.user)
+        expected = await sync_to_async(client.get)(reverse('all-events'), {'page_size': 3})
+        self.assertEqual(data['results'], expected.json()['results'])
+
+        response = await self.async_client.get(data['next'], headers=self.headers)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    async def test_user_events(self):
+        response = await self.async_client.get(reverse('async-user-events'), headers=self.headers)
+        self.assertEqual(len(response.json()['results']), 5)
+
+    async def test_fields_and_attendees(self):
+        await sync_to_async(self.events[0].add_attendee)(self.user)
+        params = {'fields': 'id,attendees', 'page_size': 1}
+        response = await self.async_client.get(reverse('async-all-events'), params, headers=self.headers)
+        self.assertEqual(response.json()['results'], [{'id': self.events[0].pk, 'attendees': [self.user.pk]}])
+
+    async def test_search(self):
+        await Event.objects.filter(pk=self.events[3].pk).aupdate(name='Python meetup')
+        client = await sync_to_async(self.authenticated_client)(self.user)
+        expected = await sync_to_async(client.get)(reverse('all-events'), {'q': 'python'})
+        self.assertEqual(len(expected.json()['results']), 1)
+
+        response = await self.async_client.get(reverse('async-all-events'), {'q': 'python'}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+        # Without FTS: icontains filter
+        with mock.patch('event_manager.async_views.fts_available', return_value=False):
+            response = await self.async_client.get(reverse('async-all-events'), {'q': 'python'}, headers=self.headers)
+        self.assertEqual([event['name'] for event in response.json()['results']], ['Python meetup'])
+
+    async def test_register_conflicts(self):
+        # Overlaps the first two events
+        workshop = await Event.objects.acreate(
+            name='Workshop', owner=self.user, start_date=self.events[0].start_date + timedelta(minutes=30),
+            end_date=self.events[1].start_date + timedelta(minutes=30),
+        )
+        for event in self.events[:2]:
+            await self.async_client.post(reverse('async-event-register', args=[event.pk]), headers=self.headers)
+        url = reverse('async-event-register', args=[workshop.pk])
+
+        response = await self.async_client.post(url + '?conflicts=sometimes', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post(url + '?conflicts=reject', headers=self.headers)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflicts'], [self.events[0].pk, self.events[1].pk])
+        self.assertFalse(await workshop.attendees.aexists())
+
+        response = await self.async_client.post(url + '?conflicts=warn', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['conflicts'], [self.events[0].pk, self.events[1].pk])
+        self.assertTrue(await workshop.attendees.aexists())
+
+    async def test_register_and_unregister(self):
+        event = self.events[0]
+        response = await self.async_client.post(reverse('async-event-register', args=[event.pk]), headers=self.headers)
+        self.assertTrue(response.json()['success'])
+        response = await self.async_client.post(reverse('async-event-register', args=[event.pk]), headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        await event.arefresh_from_db()
+        self.assertEqual(event.attendee_count, 1)
+
+        response = await self.async_client.post(reverse('async-event-unregister', args=[event.pk]), headers=self.headers)
+        self.assertEqual(response.json()['messagge'], 'user unregistred for the event')
+        response = await self.async_client.post(reverse('async-event-register', args=[0]), headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_authentication_is_required(self):
+        response = await AsyncClient().get(reverse('async-all-events'))
+        self.assertEqual(response.status_code, 401)
+        response = await AsyncClient().get(reverse('async-all-events'), headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, 401)
+
+
+class QueuedLogHandlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.filename = os.path.join(self.directory.name, 'test.log')
+
+    def make_handler(self, **kwargs):
+        handler = QueuedRotatingFileHandler(self.filename, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def record(self, message):
+        return logging.LogRecord('event_manager', logging.WARNING, __file__, 0, message, None, None)
+
+    def test_records_are_written_by_the_listener(self):
+        handler = self.make_handler()
+        handler.start()
+        for i in range(100):
+            handler.handle(self.record(f'message {i}'))
+        handler.stop()
+        with open(self.filename) as f:
+            self.assertEqual(len(f.readlines()), 100)
+
+    def test_drop_policies(self):
+        # Not started: the queue is never drained
+        handler = self.make_handler(queue_size=2)
+        for i in range(5):
+            handler.handle(self.record(f'message {i}'))
+        self.assertEqual(handler.dropped, 3)
+        self.assertEqual([r.getMessage() for r in handler.queue.queue], ['message 0', 'message 1'])
+
+        handler = self.make_handler(queue_size=2, drop_policy='drop_oldest')
+        for i in range(5):
+            handler.handle(self.record(f'message {i}'))
+        self.assertEqual([r.getMessage() for r in handler.queue.queue], ['message 3', 'message 4'])
+
+        with self.assertRaises(ValueError):
+            QueuedRotatingFileHandler(self.filename, drop_policy='never')
+
+    def test_rotation(self):
+        handler = self.make_handler(max_bytes=200, backup_count=2)
+        handler.start()
+        for i in range(50):
+            handler.handle(self.record(f'message {i}'))
+        handler.stop()
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['test.log', 'test.log.1', 'test.log.2'])
+
+    def test_event_manager_logger_is_queued(self):
+        handlers = logging.getLogger('event_manager').handlers
+        self.assertTrue(any(isinstance(h, QueuedRotatingFileHandler) and h._started for h in handlers))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user(password='password123')
+
+    def test_login_issues_one_token_pair(self):
+        with self.assertNumStatements(2):
+            # User lookup and OutstandingToken insert
+            response = APIClient().post(reverse('user-login'), {'username': 'alice', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(OutstandingToken.objects.filter(user=self.user).count(), 1)
+
+        refresh = RefreshToken(response.data['refresh_token'])
+        access = AccessToken(response.data['access_token'])
+        self.assertEqual(access['user_id'], self.user.pk)
+        self.assertEqual(refresh['jti'], OutstandingToken.objects.get().jti)
+
+    def test_invalid_credentials(self):
+        response = APIClient().post(reverse('user-login'), {'username': 'alice', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(OutstandingToken.objects.exists())
+
+
+class BlacklistCheckerTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+
+    def refresh(self, token):
+        return APIClient().post(reverse('token_refresh'), {'refresh': token})
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti{i}')
+        self.assertTrue(all(f'jti{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.03)
+        self.assertAlmostEqual(bloom.expected_error_rate(), 0.01, delta=0.005)
+
+    def test_clean_token_skips_database(self):
+        checker = get_checker()
+        checker.is_blacklisted('warm-up')
+        with self.assertNumQueries(0):
+            self.assertFalse(checker.is_blacklisted('clean'))
+        self.assertEqual(checker.stats()['skipped_database'], 2)
+
+    def test_rotated_token_is_rejected(self):
+        _, refresh = self.user.generate_tokens()
+        response = self.refresh(refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+        # The rotated token is in the filter, and confirmed by the database
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+        stats = get_checker().stats()
+        self.assertEqual(stats['blacklisted'], 1)
+        self.assertEqual(stats['false_positives'], 0)
+
+    def test_logged_out_token_is_rejected(self):
+        access, refresh = self.user.generate_tokens()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(client.post(reverse('user-logout'), {'refresh_token': refresh}).status_code, 200)
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    def test_sync_picks_up_other_processes(self):
+        checker = BloomBlacklistChecker(capacity=100, sync_interval=3600)
+        checker.is_blacklisted('warm-up')
+        token = RefreshToken.for_user(self.user)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        # Stale until the next sync
+        self.assertFalse(checker.is_blacklisted(token['jti']))
+        checker.sync()
+        self.assertTrue(checker.is_blacklisted(token['jti']))
+
+    def test_warm_checker(self):
+        reset_checker()
+        # Keep the connection of the test transaction
+        with mock.patch.object(connections, 'close_all') as close_all:
+            warm_checker()
+        close_all.assert_called_once()
+        with self.assertNumQueries(0):
+            self.assertFalse(get_checker().is_blacklisted('clean'))
+
+    def test_concurrent_first_checks_warm_once(self):
+        checker = BloomBlacklistChecker(capacity=100)
+        warms = []
+
+        def warm():
+            warms.append(1)
+            time.sleep(0.05)
+            checker.filter = BloomFilter(checker.capacity, checker.error_rate)
+            checker.synced_at = time.monotonic()
+
+        with mock.patch.object(checker, 'warm', side_effect=warm):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(checker.is_blacklisted, [f'jti{i}' for i in range(8)]))
+        self.assertEqual(results, [False] * 8)
+        self.assertEqual(len(warms), 1)
+
+    def test_false_positive_rate(self):
+        checker = BloomBlacklistChecker(capacity=100)
+        checker.is_blacklisted('warm-up')
+        checker.add('not-in-database')
+        self.assertFalse(checker.is_blacklisted('not-in-database'))
+        stats = checker.stats()
+        self.assertEqual((stats['false_positives'], stats['skipped_database']), (1, 1))
+        self.assertEqual(stats['false_positive_rate'], 0.5)
+
+    def test_stats_endpoint_is_admin_only(self):
+        url = reverse('token-blacklist-stats')
+        self.assertEqual(self.authenticated_client(self.user).get(url).status_code, 403)
+        admin = self.create_user('admin')
+        admin.is_staff = True
+        admin.save()
+        response = self.authenticated_client(admin).get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['checker'], 'BloomBlacklistChecker')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite specific')
+class SQLiteTuningTests(SimpleTestCase):
+
+    @contextmanager
+    def new_cursor(self):
+        """
+        Cursor of a new connection to a temporary database file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            default = connections['default']
+            wrapper = type(default)(dict(default.settings_dict, NAME=os.path.join(directory, 'db.sqlite3')), alias='tuning')
+            try:
+                with wrapper.cursor() as cursor:
+                    yield cursor
+            finally:
+                wrapper.close()
+
+    def pragma(self, cursor, name):
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+    @override_settings(EVENT_MANAGER_SQLITE_PRAGMAS={'synchronous': 'NORMAL', 'busy_timeout': 1234, 'cache_size': -2048})
+    def test_pragmas_applied_to_new_connections(self):
+        with self.new_cursor() as cursor:
+            self.assertEqual(self.pragma(cursor, 'synchronous'), 1)
+            self.assertEqual(self.pragma(cursor, 'busy_timeout'), 1234)
+            self.assertEqual(self.pragma(cursor, 'cache_size'), -2048)
+
+    @override_settings(EVENT_MANAGER_SQLITE_PRAGMAS={'journal_mode': 'WAL'})
+    def test_wal_journal(self):
+        with self.new_cursor() as cursor:
+            self.assertEqual(self.pragma(cursor, 'journal_mode'), 'wal')
+
+
+@override_settings(EVENT_MANAGER_DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(EventTestMixin, TransactionTestCase):
+    """
+    Two SQLite databases: the test database as primary, and a file that is a
+    copy of it taken by replicate().
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        connections.settings['replica'] = dict(
+            connections['default'].settings_dict, NAME=os.path.join(self.directory, 'replica.sqlite3')
+        )
+        self.owner = self.create_user()
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().tearDown()
+
+    def replicate(self):
+        connections['default'].ensure_connection()
+        target = sqlite3.connect(connections.settings['replica']['NAME'])
+        try:
+            connections['default'].connection.backup(target)
+        finally:
+            target.close()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {user.generate_tokens()[0]}')
+        return client
+
+    def test_lists_read_from_replica(self):
+        self.create_events(self.owner, 2)
+        self.replicate()
+        self.create_events(self.owner, 1, start=datetime(2031, 1, 1, tzinfo=timezone.utc))
+        client = self.client_for(self.owner)
+        self.assertEqual(len(client.get(reverse('all-events')).data['results']), 2)
+        self.assertEqual(len(client.get(reverse('user-events')).data['results']), 2)
+        self.assertEqual(len(client.get(reverse('events-export')).getvalue().splitlines()), 2)
+
+    def test_writer_reads_own_writes(self):
+        self.replicate()
+        writer, reader = self.client_for(self.owner), self.client_for(self.create_user('bob'))
+        response = writer.post(reverse('event-create'), {
+            'name': 'Launch', 'description': 'Launch party', 'location': 'Rome',
+            'start_date': '2030-01-01T10:00:00Z', 'end_date': '2030-01-01T12:00:00Z', 'max_capacity': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # Not replicated yet: only the writer sees the event
+        self.assertEqual(len(reader.get(reverse('all-events')).data['results']), 0)
+        self.assertEqual(len(writer.get(reverse('all-events')).data['results']), 1)
+
+    def test_registration_status_reads_from_primary(self):
+        event = self.create_events(self.owner, 1, max_capacity=1)[0]
+        event.add_attendee(self.create_user('carol'))
+        self.replicate()
+        bob = self.create_user('bob')
+        response = self.client_for(bob).post(reverse('event-register', args=[event.pk]))
+        self.assertEqual(response.status_code, 202)
+
+        # A client without the pin cookie of the registration: the replica does not have it yet
+        response = self.client_for(bob).get(response.json()['status_url'])
+        self.assertEqual(response.data['status'], 'waitlisted')
+        self.assertEqual(response.data['position'], 1)
+
+    def test_lagging_replica_reads_are_not_cached(self):
+        self.replicate()
+        writer, reader = self.client_for(self.owner), self.client_for(self.create_user('bob'))
+        reader.get(reverse('all-events'))
+        writer.post(reverse('event-create'), {
+            'name': 'Launch', 'start_date': '2030-01-01T10:00:00Z', 'end_date': '2030-01-01T12:00:00Z',
+        }, format='json')
+        # Read from the replica before it has the event, under the new generation
+        response = reader.get(reverse('all-events'))
+        self.assertEqual(len(response.data['results']), 0)
+        etag = response['ETag']
+
+        self.replicate()
+        response = reader.get(reverse('all-events'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    @override_settings(EVENT_MANAGER_DATABASE_REPLICAS=['replica1', 'replica2', 'replica3'])
+    def test_replica_is_chosen_once_per_request(self):
+        state = RoutingState()
+        state.use_replica = True
+        self.assertEqual(len({state.read_alias() for _ in range(50)}), 1)
+
+    def test_writes_go_to_primary(self):
+        event = self.create_events(self.owner, 1)[0]
+        self.replicate()
+        client = self.client_for(self.create_user('bob'))
+        self.assertEqual(client.post(reverse('event-register', args=[event.pk])).status_code, 200)
+        self.assertEqual(Event.objects.using('default').get().attendee_count, 1)
+        self.assertEqual(Event.objects.using('replica').get().attendee_count, 0)
+
+
+class TokenPruningTests(EventTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_cache().delete(PRUNE_LEASE_KEY)
+        self.user = self.create_user()
+        now = datetime.now(timezone.utc)
+        for i in range(5):
+            expired = OutstandingToken.objects.create(user=self.user, jti=f'expired{i}', token='x', expires_at=now - timedelta(hours=1))
+            valid = OutstandingToken.objects.create(user=self.user, jti=f'valid{i}', token='x', expires_at=now + timedelta(hours=1))
+            if i % 2:
+                BlacklistedToken.objects.create(token=expired)
+                BlacklistedToken.objects.create(token=valid)
+
+    def test_prune_in_batches(self):
+        result = prune_expired_tokens(batch_size=2)
+        self.assertEqual((result['blacklisted'], result['outstanding']), (2, 5))
+        self.assertEqual(OutstandingToken.objects.count(), 5)
+        self.assertEqual(BlacklistedToken.objects.count(), 2)
+        self.assertFalse(OutstandingToken.objects.filter(jti__startswith='expired').exists())
+
+    def test_max_batches(self):
+        result = prune_expired_tokens(batch_size=2, max_batches=1)
+        self.assertEqual((result['blacklisted'], result['outstanding']), (2, 2))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('prune_tokens', batch_size=3, stdout=out)
+        self.assertIn('Removed 2 blacklisted and 5 outstanding tokens', out.getvalue())
+
+    def test_scheduler_run(self):
+        result = TokenPruneScheduler(interval=60).run_once()
+        self.assertEqual(result['outstanding'], 5)
+
+    def test_scheduler_runs_once_per_interval(self):
+        # The lease of this interval, taken by another worker process
+        self.assertTrue(caches.create_connection(settings.EVENT_MANAGER_CACHE).add(PRUNE_LEASE_KEY, 1, timeout=60))
+        self.assertIsNone(TokenPruneScheduler(interval=60).run_once())
+        self.assertEqual(OutstandingToken.objects.count(), 10)
+
+    @override_settings(EVENT_MANAGER_TOKEN_PRUNE_INTERVAL=60, EVENT_MANAGER_WORKERS=4)
+    def test_scheduler_needs_shared_cache_with_several_workers(self):
+        with mock.patch('event_manager.tokens._scheduler', None), self.assertLogs('event_manager', 'WARNING'):
+            start_token_pruning()
+            self.assertIs(tokens._scheduler, False)
@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, DatabaseError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from .cache import check_shared_cache, get_cache
+
+logger = logging.getLogger('event_manager')
+
+# Cache key of the lease of the process pruning the tokens for the current interval
+PRUNE_LEASE_KEY = 'tokens:prune:lease'
+
+
+def delete_in_batches(queryset, batch_size, max_batches=None, pause=0):
+    """
+    Delete the rows of a queryset in batches of at most batch_size rows.
+
+    Each batch is its own short transaction, so writers (logins, refreshes,
+    logouts) are never blocked for long.
+
+    Returns:
+        int: The number of deleted rows.
+    """
+    model = queryset.model
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            _, per_model = model.objects.filter(pk__in=ids).delete()
+        deleted += per_model.get(model._meta.label, 0)
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def prune_expired_tokens(batch_size=None, max_batches=None, pause=0):
+    """
+    Delete the expired rows of the token_blacklist tables.
+
+    Expired tokens fail validation before the blacklist is checked, so their
+    rows are useless; without pruning, the tables (and every lookup in them)
+    grow without limit.
+
+    Args:
+        batch_size (int): Rows deleted per transaction (default EVENT_MANAGER_TOKEN_PRUNE_BATCH_SIZE).
+        max_batches (int): Maximum number of batches per table (default: until done).
+        pause (float): Seconds to sleep between batches.
+
+    Returns:
+        dict: The number of removed blacklisted and outstanding tokens, and the seconds spent.
+    """
+    batch_size = batch_size or settings.EVENT_MANAGER_TOKEN_PRUNE_BATCH_SIZE
+    started = time.perf_counter()
+    now = timezone.now()
+    # Blacklist rows first, so that deleting outstanding tokens does not cascade
+    blacklisted = delete_in_batches(
+        BlacklistedToken.objects.filter(token__expires_at__lt=now), batch_size, max_batches, pause
+    )
+    outstanding = delete_in_batches(
+        OutstandingToken.objects.filter(expires_at__lt=now), batch_size, max_batches, pause
+    )
+    return {
+        'blacklisted': blacklisted,
+        'outstanding': outstanding,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+class TokenPruneScheduler(threading.Thread):
+    """
+    Daemon thread running prune_expired_tokens every interval seconds.
+
+    Every worker process runs one, but only the process that takes the lease
+    of the interval in the event_manager cache (an atomic add()) prunes, so
+    the workers do not compete for the database write lock with the same
+    DELETEs.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='event_manager-token-prune', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run_once(self):
+        """
+        Prune the expired tokens, unless another process took the lease of this interval.
+
+        Returns:
+            dict: The result of prune_expired_tokens, or None if not run.
+        """
+        if not get_cache().add(PRUNE_LEASE_KEY, os.getpid(), timeout=self.interval):
+            return None
+        try:
+            result = prune_expired_tokens()
+            logger.info(
+                'Pruned %(blacklisted)d blacklisted and %(outstanding)d outstanding tokens in %(seconds).3fs',
+                result,
+            )
+            return result
+        except DatabaseError as e:
+            logger.warning(f'Token pruning failed: {e}')
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+            # Do not keep a connection open between runs
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_token_pruning(**kwargs):
+    """
+    Start the token pruning scheduler of this process, if enabled.
+
+    Connected to request_started, so that only processes serving requests
+    (not management commands) run it. Not started if several worker processes
+    would not share the lease (see check_shared_cache): run the prune_tokens
+    management command from cron instead.
+    """
+    global _scheduler
+    interval = settings.EVENT_MANAGER_TOKEN_PRUNE_INTERVAL
+    if not interval or _scheduler is not None:
+        return
+    with _scheduler_lock:
+        if _scheduler is None:
+            if not check_shared_cache():
+                logger.warning('Token pruning scheduler not started: run the prune_tokens command from cron.')
+                # Do not check again on every request
+                _scheduler = False
+                return
+            _scheduler = TokenPruneScheduler(interval)
+            _scheduler.start()
@@ -17,6 +17,7 @@ Including another URLconf
 from django.urls import path, include
 from rest_framework import routers
 from .views import *
+from . import async_views
 from rest_framework.urlpatterns import format_suffix_patterns
 from rest_framework_simplejwt import views as jwt_views
 
@@ -31,26 +32,56 @@ urlpatterns = [
     # override sjwt stock token
     path('token/refresh/', jwt_views.TokenRefreshView.as_view(), name='token_refresh'),
 
+    # # Refresh token blacklist checker counters
+    path('token/blacklist/stats/', token_blacklist_stats, name='token-blacklist-stats'),
+
+    # # Per-view request metrics
+    path('metrics/', performance_metrics, name='performance-metrics'),
+
     # # User logout
     path('logout/', logout_user, name='user-logout'),
 
     # # Event creation
     path('events/create/', create_event, name='event-create'),
 
+    # # Bulk event creation
+    path('events/bulk/', bulk_create_events, name='event-bulk-create'),
+
     # # User events
     path('events/user/', fetch_user_events, name='user-events'),
 
+    # # User schedule (attended events, streamed)
+    path('events/schedule/', fetch_user_schedule, name='user-schedule'),
+
     # # All events
     path('events/', list_events, name='all-events'),
 
+    # # All events export (streamed)
+    path('events/export/', export_events, name='events-export'),
+
+    # # All events cache counters
+    path('events/cache/', event_cache_stats, name='events-cache-stats'),
+
     # # Event editing
     path('events/<int:event_id>/edit/', edit_event, name='event-edit'),
 
+    # # Event attendees
+    path('events/<int:event_id>/attendees/', event_attendees, name='event-attendees'),
+
     # # Event registration
     path('events/<int:event_id>/register/', register_event, name='event-register'),
 
     # # Event unregistration
     path('events/<int:event_id>/unregister/', unregister_event, name='event-unregister'),
+
+    # # Registration and waitlist status of the user (polled by the waitlisted clients)
+    path('events/<int:event_id>/status/', event_status, name='event-status'),
+
+    # # Async (ASGI-native) versions of the read and registration endpoints
+    path('async/events/user/', async_views.fetch_user_events, name='async-user-events'),
+    path('async/events/', async_views.list_events, name='async-all-events'),
+    path('async/events/<int:event_id>/register/', async_views.register_event, name='async-event-register'),
+    path('async/events/<int:event_id>/unregister/', async_views.unregister_event, name='async-event-unregister'),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
\ No newline at end of file
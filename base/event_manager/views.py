@@ -1,6 +1,9 @@
 from datetime import datetime, timezone
 from django.contrib.auth import authenticate, login, logout
-from django.http import Http404, JsonResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import permissions, status
 from rest_framework.decorators import api_view, permission_classes
@@ -16,6 +19,16 @@ import logging
 
 from .serializers import *
 from .models import *
+from .pagination import AttendeePagination, EventCursorPagination, EventSearchPagination
+from .search import fts_available, search_filter
+from .schedule import stream_schedule
+from .filters import filter_events, InvalidFilter
+from .cache import cache_event_list, invalidate_event_list_on_commit, stats as cache_stats
+from .conditional import conditional_event_list
+from .export import EXPORT_FORMATS, stream_events
+from .routers import read_from_replica
+from .blacklist import CheckedRefreshToken, get_checker as get_blacklist_checker
+from .metrics import registry as metrics_registry, timed
 # Get an instance of a logger
 logger = logging.getLogger('event_manager')
 
@@ -112,10 +125,10 @@ def login_user(request):
     if user is None:
         return Response({"error": "Invalid username or password."}, status=401)
 
-    access_token = RefreshToken.for_user(user).access_token
-    refresh_token = RefreshToken.for_user(user)
+    # One refresh token (one OutstandingToken row) and its access token
+    access_token, refresh_token = user.generate_tokens()
     return Response(
-        {"access_token": str(access_token), "refresh_token": str(refresh_token)}
+        {"access_token": access_token, "refresh_token": refresh_token}
     )
 
 
@@ -128,7 +141,7 @@ def logout_user(request):
     try:
         access_token = request.data.get('refresh_token')
        
-        token = RefreshToken(access_token)
+        token = CheckedRefreshToken(access_token)
         token.blacklist()
         logout(request)
         return Response({'success': 'Successfully logged out.'}, status=status.HTTP_200_OK)
@@ -171,9 +184,76 @@ def create_event(request):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_create_events(request):
+    """
+    API endpoint for creating many events in one request (e.g. importing a schedule).
+
+    Parameters:
+    -----------
+    request: Request
+        Django request object
+
+    Input:
+    ------
+    The request should contain a JSON list of events, with the same fields as
+    create_event (at most EVENT_MANAGER_BULK_MAX_EVENTS).
+    atomic: bool (optional, query parameter)
+        All-or-nothing mode: if any event is invalid, none is created.
+        Otherwise the valid events are created and the invalid ones reported.
+
+    Output:
+    -------
+    Returns a JSON response with the ids of the created events in `created`
+    (in request order) and the errors of the invalid events, with their index
+    in the request, in `errors`. The status is 201 if any event was created,
+    400 otherwise.
+    """
+    atomic = request.query_params.get('atomic', '').lower() in ('1', 'true', 'yes')
+    serializer = BulkEventSerializer(
+        child=EventSerializer(), data=request.data, allow_empty=False, max_length=settings.EVENT_MANAGER_BULK_MAX_EVENTS,
+    )
+
+    if serializer.is_valid():
+        items, errors = serializer.validated_data, []
+    elif isinstance(serializer.errors, dict):
+        # Not a list, empty or too long
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        errors = [{'index': index, 'errors': item_errors} for index, item_errors in enumerate(serializer.errors) if item_errors]
+        if atomic:
+            return Response({'created': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        # Keep the valid events only, as validated by the first pass
+        items = serializer.valid_items
+
+    owner = request.user
+    with transaction.atomic():
+        events = Event.objects.bulk_create(
+            [Event(owner=owner, **item) for item in items],
+            batch_size=settings.EVENT_MANAGER_BULK_BATCH_SIZE,
+        )
+        # bulk_create does not send post_save
+        invalidate_event_list_on_commit()
+
+    created = [event.pk for event in events]
+    return Response(
+        {'created': created, 'errors': errors},
+        status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def user_events_condition(request):
+    # The events of the response, and what else (besides the query params) it depends on
+    return Event.objects.filter(owner=request.user), (request.user.pk,)
+
+
 @api_view(['GET'])
 @csrf_exempt
 @permission_classes([permissions.IsAuthenticated])
+@read_from_replica
+@conditional_event_list(user_events_condition)
 def fetch_user_events(request):
     """
     API endpoint for getting all events created by the current user.
@@ -182,11 +262,26 @@ def fetch_user_events(request):
         request: HTTP request object.
 
     Returns:
-        Response: JSON response containing a list of all events created by the current user.
+        Response: JSON response containing a page of the events created by the current user,
+        ordered by start date, and the link to the next page. Supports the fields
+        and include query params of list_events, and conditional requests
+        (ETag).
     """
-    events = Event.objects.filter(owner=request.user)
-    serializer = EventSerializer(events, many=True)
-    return Response(serializer.data)
+    try:
+        serializer = EventValuesSerializer(list_fields(request.query_params))
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    paginator = EventCursorPagination()
+    events = serializer.get_queryset(Event.objects.filter(owner=request.user), *paginator.ordering)
+    page = paginator.paginate_queryset(events, request)
+    with timed('serialize'):
+        data = serializer.to_representation(page)
+    return paginator.get_paginated_response(data)
+
+
+def list_events_condition(request):
+    return filter_events(Event.objects.all(), request.query_params), ()
+
 
 @swagger_auto_schema(
     order=3,
@@ -196,6 +291,9 @@ def fetch_user_events(request):
 )
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@read_from_replica
+@conditional_event_list(list_events_condition)
+@cache_event_list
 def list_events(request):
     """
     API endpoint to list all events.
@@ -209,48 +307,191 @@ def list_events(request):
     ------
     status: str (optional)
         Filter events by status (upcoming, ongoing, past).
-    date: str (optional)
-        Filter events by date (YYYY-MM-DD).
+    start_date: str (optional)
+        Filter events starting on a date (YYYY-MM-DD).
+    end_date: str (optional)
+        Filter events ending on a date (YYYY-MM-DD).
+    from, to: str (optional)
+        Filter events overlapping the window [from, to) (ISO 8601 datetimes, or
+        dates for their start); either may be omitted.
+    q: str (optional)
+        Full-text search in the name, description and location (every word must
+        match, the last one as a prefix).
+    cursor: str (optional)
+        Opaque cursor returned in the `next` link of the previous page.
+    page_size: int (optional)
+        Number of events per page, capped by EVENT_MANAGER_MAX_PAGE_SIZE.
+    include: str (optional)
+        `attendees` to add the attendee ids to each event.
+    fields: str (optional)
+        Comma separated fields of the events to return (e.g. `id,name,start_date`).
 
     Output:
     -------
-    Returns a JSON response with a list of serialized event objects.
-    """
-    status = request.query_params.get('status')
-    start_date = request.query_params.get('start_date')
-    end_date = request.query_params.get('end_date')
-
-    # Filter events by status
-    if status:
-        today = datetime.now().date()
-        if status == 'upcoming':
-            events = Event.objects.filter(start_date__gte=today)
-        elif status == 'ongoing':
-            events = Event.objects.filter(start_date__lte=today, end_date__gte=today)
-        elif status == 'past':
-            events = Event.objects.filter(end_date__lt=today)
+    Returns a JSON response with a page of serialized event objects ordered by
+    (start_date, id) in `results` (by relevance when searching), and the link to
+    the next page in `next`. Events carry their attendee_count and spots_left;
+    the attendees of an event are listed by event_attendees.
+    Responses are cached until the next write to events (see event_manager.cache),
+    and conditional requests (If-None-Match) are answered with
+    304 Not Modified when the events did not change.
+    """
+    query = request.query_params.get('q')
+    try:
+        fields = list_fields(request.query_params)
+        events = filter_events(Event.objects.all(), request.query_params)
+        if query and fts_available(events.db):
+            paginator = EventSearchPagination()
+            page = paginator.paginate_search(only_list_fields(events, fields), query, request)
+            with timed('serialize'):
+                data = EventListSerializer(page, many=True, context={'fields': fields}).data
         else:
-            return Response({'error': 'Invalid status filter'}, status=status.HTTP_400_BAD_REQUEST)
-    else:
-        events = Event.objects.all()
+            if query:
+                events = events.filter(search_filter(query))
+            paginator = EventCursorPagination()
+            serializer = EventValuesSerializer(fields)
+            page = paginator.paginate_queryset(serializer.get_queryset(events, *paginator.ordering), request)
+            with timed('serialize'):
+                data = serializer.to_representation(page)
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return paginator.get_paginated_response(data)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@read_from_replica
+def event_attendees(request, event_id):
+    """
+    API endpoint listing the attendees of an event.
+
+    Args:
+        request: HTTP request object.
+        event_id: ID of the event.
+
+    Returns:
+        Response: JSON response with a page of attendees (id and username) ordered
+        by id, and the link to the next page (`cursor` and `page_size` query params).
+    """
+    if not Event.objects.filter(id=event_id).exists():
+        raise Http404('Event does not exist')
+    attendees = CustomUser.objects.filter(events_attending=event_id).only('id', 'username')
+    paginator = AttendeePagination()
+    page = paginator.paginate_queryset(attendees, request)
+    with timed('serialize'):
+        data = AttendeeSerializer(page, many=True).data
+    return paginator.get_paginated_response(data)
+
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@read_from_replica
+def export_events(request):
+    """
+    API endpoint streaming all events, for reporting.
+
+    Parameters:
+    -----------
+    request: Request
+        Django request object
+
+    Input:
+    ------
+    output: str (optional)
+        Export format: ndjson (one JSON object per line, default) or csv.
+    status, start_date, end_date, from, to: str (optional)
+        Same filters as list_events.
+
+    Output:
+    -------
+    Returns a streaming response with the events ordered by (start_date, id).
+    Events are read in chunks, so memory does not grow with the number of events.
+    """
+    export_format = request.query_params.get('output', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return Response({'error': 'Invalid output format (use ndjson or csv)'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        events = filter_events(Event.objects.all(), request.query_params)
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Choose the database now: the rows are read after the view has returned
+    events = events.using(events.db)
+    response = StreamingHttpResponse(stream_events(events, export_format), content_type=EXPORT_FORMATS[export_format])
+    if export_format == 'csv':
+        response['Content-Disposition'] = 'attachment; filename="events.csv"'
+    return response
 
-    # Filter events by date
-    if start_date:
-        try:
-            date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            events = events.filter(start_date__date=date_obj)
-        except ValueError:
-            return Response({'error': 'Invalid date filter (use YYYY-MM-DD format)'}, status=status.HTTP_400_BAD_REQUEST)
-    if end_date:
-        try:
-            date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            events = events.filter(end_date__date=date_obj)
-        except ValueError:
-            return Response({'error': 'Invalid date filter (use YYYY-MM-DD format)'}, status=status.HTTP_400_BAD_REQUEST)
 
-    serializer = EventSerializer(events, many=True)
-    return Response(serializer.data)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@read_from_replica
+def fetch_user_schedule(request):
+    """
+    API endpoint streaming the schedule of the current user: the events they
+    attend, ordered by start date.
 
+    Parameters:
+    -----------
+    request: Request
+        Django request object
+
+    Input:
+    ------
+    status, start_date, end_date, from, to: str (optional)
+        Same filters as list_events.
+
+    Output:
+    -------
+    Returns a streamed JSON list of events (id, name, start_date, end_date,
+    location), each with the ids of the earlier events of the schedule it
+    overlaps in `overlaps`.
+    """
+    try:
+        events = filter_events(Event.objects.filter(attendees=request.user), request.query_params)
+    except InvalidFilter as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Choose the database now: the rows are read after the view has returned
+    events = events.using(events.db)
+    return StreamingHttpResponse(stream_schedule(events), content_type='application/json')
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def event_cache_stats(request):
+    """
+    API endpoint returning the hit/miss counters of the event list cache of this process.
+    """
+    return Response(cache_stats.as_dict())
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def token_blacklist_stats(request):
+    """
+    API endpoint returning the counters (including the false positive rate) of the
+    refresh token blacklist checker of this process.
+    """
+    return Response(get_blacklist_checker().stats())
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def performance_metrics(request):
+    """
+    API endpoint returning the per-view request metrics of this process (wall
+    time, database queries and time, serializer and renderer time, response
+    bytes, see event_manager.metrics), with the event list cache and refresh
+    token blacklist checker counters.
+    """
+    return Response({
+        'views': metrics_registry.as_dict(),
+        'event_list_cache': cache_stats.as_dict(),
+        'token_blacklist': get_blacklist_checker().stats(),
+    })
 
 
 @api_view(['PUT'])
@@ -272,7 +513,7 @@ def edit_event(request, event_id):
     """
 
     try:        
-        event = Event.objects.get(pk=event_id)
+        event = Event.objects.select_related('owner').get(pk=event_id)
     except Event.DoesNotExist:
         raise Http404('Event does not exist.')
     
@@ -282,11 +523,34 @@ def edit_event(request, event_id):
     
     serializer = EditEventSerializer(event, data=request.data)
     if serializer.is_valid():
-        serializer.save()
+        if 'max_capacity' not in serializer.validated_data:
+            serializer.save()
+        else:
+            # One transaction: the seats of a raised capacity go to the waitlist
+            # before any new registration, and are not added if the promotion fails.
+            # It starts with a write that does not fire the full-text search
+            # trigger, to wait for the write lock (see Event.promote_waitlist)
+            with transaction.atomic():
+                Event.objects.filter(pk=event.pk).update(max_capacity=serializer.validated_data['max_capacity'])
+                serializer.save()
+                event.promote_waitlist()
         return Response({'message': 'Event updated successfully.', 'data': serializer.data})
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def waitlisted_data(event, place):
+    """
+    Return the response data of a registration put on the waitlist of a full event.
+    """
+    return {
+        'success': False,
+        'error': 'Event has reached its maximum capacity',
+        'waitlisted': True,
+        'position': place,
+        'status_url': reverse('event-status', args=[event.pk]),
+    }
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def register_event(request, event_id):
@@ -294,14 +558,25 @@ def register_event(request, event_id):
     Register the authenticated user to an event.
 
     Args:
-        request: HttpRequest object representing the current request.
+        request: HttpRequest object representing the current request. The optional
+            ``conflicts`` query parameter checks the overlap with the events the
+            user attends: ``reject`` refuses the registration, ``warn`` registers
+            and lists the overlapping events.
         event_id: The ID of the event to register to.
 
     Returns:
         A JSON response containing the updated event data on success, or a
-        404 error response if the event was not found, or a 400 error response
-        if the authenticated user is already registered to the event.
+        202 response with the place in line and the status URL to poll if the
+        event is full and the user was put on its waitlist, or a 404 error
+        response if the event was not found, or a 400 error response if the
+        authenticated user is already registered to the event, or a 409 error
+        response with the ids of the overlapping events if conflicts are
+        rejected.
     """
+    conflicts = request.query_params.get('conflicts', 'ignore')
+    if conflicts not in ('ignore', 'warn', 'reject'):
+        return Response({'error': 'Invalid conflicts option (use ignore, warn or reject)'}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
         event = Event.objects.get(id=event_id)
     except Event.DoesNotExist:
@@ -311,33 +586,37 @@ def register_event(request, event_id):
     if event.start_date < datetime.now(timezone.utc):
         return Response({"error": "You can only register for future events."}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Check if the user is already registered for the event
-    if request.user in event.attendees.all():
+    # Add the user as an attendee, atomically checking membership and capacity,
+    # or to the waitlist if the event is full
+    try:
+        entry = event.add_attendee(request.user, reject_conflicts=conflicts == 'reject', waitlist=True)
+    except AlreadyRegistered:
         return Response({'error': 'You are already registered to this event.'}, status=status.HTTP_400_BAD_REQUEST)
-    # Check if the event has already reached its maximum capacity
-    if event.max_capacity and event.attendees.count() >= event.max_capacity:
-        return Response({"success": False, "error": "Event has reached its maximum capacity"})
-    
-    # Add the user as an attendee to the event
-    user = request.user
-    event.attendees.add(user)
-
-    # Register the user for the event
-    serializer = RegisterEventSerializer(instance=event, data={"attendees": [request.user.id]}, partial=True, context={'request': request})
+    except AlreadyWaitlisted:
+        # Registering again does not lose the place in line
+        entry = event.waitlist.filter(user_id=request.user.pk).first()
+        if entry is None:
+            return Response({'error': 'You are already registered to this event.'}, status=status.HTTP_400_BAD_REQUEST)
+    except ScheduleConflict as e:
+        return Response(
+            {'error': 'The event overlaps events you are registered to.', 'conflicts': e.conflicts},
+            status=status.HTTP_409_CONFLICT,
+        )
 
-    if serializer.is_valid():
-        # Add the user as an attendee to the event
-        serializer.save()
-        return JsonResponse({"success": True, 'messagge': 'user registred for the event'})
-    else:
-        return JsonResponse({"success": False, "error": serializer.errors})
+    if entry is not None:
+        return Response(waitlisted_data(event, entry.get_place()), status=status.HTTP_202_ACCEPTED)
+    data = {"success": True, 'messagge': 'user registred for the event'}
+    if conflicts == 'warn':
+        data['conflicts'] = event.get_conflicts(request.user)
+    return JsonResponse(data)
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def unregister_event(request, event_id):
     """
-    Unregister the authenticated user from an event.
+    Unregister the authenticated user from an event, or from its waitlist. The
+    freed seat goes to the head of the waitlist, in the same transaction.
 
     Args:
         request: HttpRequest object representing the current request.
@@ -357,17 +636,48 @@ def unregister_event(request, event_id):
     if event.start_date < datetime.now(timezone.utc):
         return Response({"error": "You can only unregister for future events."}, status=status.HTTP_400_BAD_REQUEST)
 
-    try:
-        # Unregister the user from the event
-        event = Event.objects.get(id=event_id)
-        attendees = event.attendees.all()
-        if request.user not in attendees:
-            return JsonResponse({"success": True, "error": "User is not registered for this event"})
-        event.attendees.remove(request.user)
-        event.save()
+    # Unregister the user from the event (the head of the waitlist gets the seat),
+    # or from its waitlist
+    if event.remove_attendee(request.user):
         return JsonResponse({"success": True, "messagge": "user unregistred for the event"})
-    except Exception as e:
-        return JsonResponse({"success": False, "error": e })
+    if event.leave_waitlist(request.user):
+        return JsonResponse({"success": True, "messagge": "user removed from the waitlist"})
+    return JsonResponse({"success": True, "error": "User is not registered for this event"})
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def event_status(request, event_id):
+    """
+    API endpoint returning the registration status of the authenticated user for
+    an event, for clients waiting on its waitlist to poll instead of retrying
+    the registration. It reads from the primary database, so polling clients
+    see their own registration even without the replica pin cookie.
+
+    Args:
+        request: HttpRequest object representing the current request.
+        event_id: The ID of the event.
+
+    Returns:
+        A JSON response with the status of the user (registered, waitlisted or
+        none), the place in line if waitlisted (1 for the next promoted user)
+        and the seats of the event, or a 404 error response if the event was not
+        found.
+    """
+    try:
+        event = Event.objects.only('id', 'max_capacity', 'attendee_count').get(pk=event_id)
+    except Event.DoesNotExist:
+        raise Http404("Event does not exist")
+
+    registration, place = event.get_registration_status(request.user)
+    return Response({
+        'event': event.pk,
+        'status': registration or 'none',
+        'position': place,
+        'attendee_count': event.attendee_count,
+        'max_capacity': event.max_capacity,
+        'spots_left': spots_left(event.max_capacity, event.attendee_count),
+    })
 
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
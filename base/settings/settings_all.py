@@ -4,6 +4,7 @@ Django settings for all subprojects and all environments
 
 from datetime import timedelta
 from pathlib import Path
+import importlib.util
 import os.path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -71,7 +72,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'event_manager.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'event_manager.compression.CompressionMiddleware',
+    'event_manager.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -100,6 +104,32 @@ TEMPLATES = [
 DATABASES = {
 }
 
+# Cache config
+# The event_manager cache holds the pages of the event list; the local-memory
+# backend evicts the least recently used entries above MAX_ENTRIES.
+# The local-memory backend is per process, and so is the generation counter that
+# writes bump to invalidate the pages (see event_manager.cache): when more than one
+# worker process serves requests, use a shared backend with an atomic incr (Redis,
+# Memcached), or the other workers serve stale lists for up to TIMEOUT.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'event_manager': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'event_manager',
+        # Bounds the staleness of the status filters, relative to the current day
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+EVENT_MANAGER_CACHE = 'event_manager'
+# Worker processes serving requests (WEB_CONCURRENCY, as read by gunicorn and
+# uvicorn): a per-process event_manager cache is reported at startup above one
+EVENT_MANAGER_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -118,6 +148,21 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashers: the first one hashes new passwords.
+# EVENT_MANAGER_PASSWORD_HASHER puts a cheaper hasher first (e.g.
+# django.contrib.auth.hashers.MD5PasswordHasher) for staging/load-test
+# environments, where PBKDF2 would dominate login time. Never set it in production:
+# stored passwords are rehashed with it on the next login.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if os.environ.get('EVENT_MANAGER_PASSWORD_HASHER'):
+    PASSWORD_HASHERS.insert(0, os.environ['EVENT_MANAGER_PASSWORD_HASHER'])
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -136,10 +181,17 @@ LOGGING = {
         }
     },
     'handlers': {
+        # Records are queued and written by a background thread started by
+        # EventManagerConfig.ready(); when the queue is full they are dropped
+        # (drop_policy: drop_new, drop_oldest or block)
         'file_event_manager': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
+            'class': 'event_manager.log_handlers.QueuedRotatingFileHandler',
             'filename': os.path.join(LOG_DIR, 'event_manager.%s.log' % hostname),
+            'max_bytes': 10 * 1024 * 1024,
+            'backup_count': 5,
+            'queue_size': 10000,
+            'drop_policy': 'drop_new',
         }, 
     },
     'loggers': {        
@@ -186,9 +238,14 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 # }
 
 DEFAULT_RENDERER_CLASSES = (
-    'rest_framework.renderers.JSONRenderer',
+    'event_manager.renderers.FastJSONRenderer',
     # 'rest_framework_simplejwt.authentication.JWTAuthentication',
 )
+# MessagePack responses for clients sending "Accept: application/msgpack"
+if importlib.util.find_spec('msgpack'):
+    DEFAULT_RENDERER_CLASSES = DEFAULT_RENDERER_CLASSES + (
+        'event_manager.renderers.MessagePackRenderer',
+    )
 if DEBUG:
     DEFAULT_RENDERER_CLASSES = DEFAULT_RENDERER_CLASSES + (
         'rest_framework.renderers.BrowsableAPIRenderer',
@@ -198,6 +255,7 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': DEFAULT_RENDERER_CLASSES,
 }
 
 SIMPLE_JWT = {
@@ -211,6 +269,74 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    # Checks the blacklist through EVENT_MANAGER_BLACKLIST_CHECKER
+    'TOKEN_REFRESH_SERIALIZER': 'event_manager.blacklist.CheckedTokenRefreshSerializer',
+}
+
+LOGIN_REDIRECT_URL='user-register'
+
+# Expired token pruning (see event_manager.tokens): rows deleted per transaction,
+# and the interval in seconds of the in-process scheduler (None disables it; run
+# the prune_tokens management command from cron instead). Worker processes take
+# turns through a lease in the event_manager cache, which must then be shared.
+EVENT_MANAGER_TOKEN_PRUNE_BATCH_SIZE = 1000
+EVENT_MANAGER_TOKEN_PRUNE_INTERVAL = None
+
+# Event listing pagination (cursor based, ordered by start_date and id)
+EVENT_MANAGER_PAGE_SIZE = 100
+EVENT_MANAGER_MAX_PAGE_SIZE = 1000
+
+# Bulk event creation: maximum events per request and per INSERT
+EVENT_MANAGER_BULK_MAX_EVENTS = 5000
+EVENT_MANAGER_BULK_BATCH_SIZE = 500
+
+# Number of events read per query by the streaming export
+EVENT_MANAGER_EXPORT_CHUNK_SIZE = 2000
+# Refresh token blacklist checker (see event_manager.blacklist): the bloom filter
+# checker only queries the database for blacklisted tokens and false positives;
+# tokens blacklisted by other processes are picked up within sync_interval seconds.
+# Use event_manager.blacklist.DatabaseBlacklistChecker to query on every refresh.
+EVENT_MANAGER_BLACKLIST_CHECKER = {
+    'CLASS': 'event_manager.blacklist.BloomBlacklistChecker',
+    'OPTIONS': {
+        'capacity': 1_000_000,
+        'error_rate': 0.001,
+        'sync_interval': 1.0,
+    },
 }
 
-LOGIN_REDIRECT_URL='user-register'
\ No newline at end of file
+# PRAGMAs run on every new SQLite connection (see event_manager.sqlite): WAL lets
+# readers run during a write, synchronous=NORMAL is durable in WAL mode except on
+# power loss, busy_timeout (ms) makes writers wait for the lock instead of failing,
+# and the memory map and page cache (negative: KiB) speed up reads
+EVENT_MANAGER_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+
+# Read replicas (see event_manager.routers): aliases of DATABASES serving the reads
+# of the listing endpoints, and the seconds a client that wrote keeps reading from
+# the primary (an upper bound of the replication lag)
+DATABASE_ROUTERS = ['event_manager.routers.ReplicaRouter']
+EVENT_MANAGER_DATABASE_REPLICAS = []
+EVENT_MANAGER_REPLICA_PIN_SECONDS = 5
+
+# Events lasting longer than this are "long" for the from/to overlap filter of the
+# event lists: they are looked up apart, the others through a bounded index range
+EVENT_MANAGER_OVERLAP_MAX_DURATION = timedelta(days=2)
+
+# Response compression (see event_manager.compression): responses of at least
+# this many bytes are compressed with Brotli at this quality (0-11) when the
+# brotli package is installed and the client accepts it, else with gzip
+EVENT_MANAGER_COMPRESSION_MIN_SIZE = 1024
+EVENT_MANAGER_BROTLI_QUALITY = 5
+
+# Per-request metrics (see event_manager.metrics): the Server-Timing response
+# header, and the share of the queries slower than EVENT_MANAGER_SLOW_QUERY_MS
+# logged to the event_manager logger
+EVENT_MANAGER_SERVER_TIMING = True
+EVENT_MANAGER_SLOW_QUERY_MS = 100
+EVENT_MANAGER_SLOW_QUERY_SAMPLE_RATE = 0.1
@@ -26,9 +26,22 @@ DATABASES = {
     'default': {          
        'ENGINE': 'django.db.backends.sqlite3',
        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+       # Keep connections (and their PRAGMAs, see EVENT_MANAGER_SQLITE_PRAGMAS) between requests
+       'CONN_MAX_AGE': 600,
+       'CONN_HEALTH_CHECKS': True,
+       'OPTIONS': {
+           # Seconds a writer waits for the database lock before "database is locked"
+           'timeout': 20,
+       },
     }
 }
 
+# Read replicas: comma separated SQLite files kept in sync with the primary
+# (e.g. by LiteFS), served as replica0, replica1...
+for index, name in enumerate(filter(None, os.environ.get('EVENT_MANAGER_SQLITE_REPLICAS', '').split(','))):
+    DATABASES[f'replica{index}'] = dict(DATABASES['default'], NAME=name, TEST={'MIRROR': 'default'})
+EVENT_MANAGER_DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
 # The ID, as an integer, of the current site in the django_site database table.
 # This is used so that application data can hook into specific site(s) and a
 # single database can manage content for multiple sites.
@@ -6,6 +6,16 @@ import os
 from .settings_common import *
 
 
+# Settings siti
+SITES = {
+    'event_manager': {
+        'domain':           'localhost',
+        'base_url':         '/',
+        'media_url':        '/',
+        'static_url':       'static/',
+    },
+}
+
 # Site config
 DOMAIN = SITES['event_manager']['domain']
 
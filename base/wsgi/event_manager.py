@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings.settings_event_manager')
 
 application = get_wsgi_application()
+
+# Build the refresh token blacklist filter before serving requests
+from event_manager.blacklist import warm_checker  # noqa: E402
+
+warm_checker()